@@ -0,0 +1,134 @@
+import math
+from geometry import aabbOverlap
+
+
+def bounding_box(entity: 'Entity') -> tuple:
+    # Returns the axis-aligned bounding box of the entity's geometry as (xmin, ymin, xmax, ymax)
+    return entity.obj.aabb
+
+
+class UniformGrid:
+    # A spatial hash over square cells of size cell_size (in meters). Each entity is registered in all cells that its bounding box
+    # overlaps, so only entities that share a cell can be candidates for a collision. Entities that would cover more than max_cells
+    # cells (e.g. a RingBuilding around the whole map) are kept in a separate list and are tested against everything instead.
+    def __init__(self, cell_size: float = 10., max_cells: int = 256):
+        self.cell_size = cell_size
+        self.max_cells = max_cells
+        self.clear()
+
+    def clear(self):
+        self.cells = {} # (i, j) -> {id(entity): entity}
+        self.entities = {} # id(entity) -> entity, for all entities in the grid
+        self.boxes = {} # id(entity) -> bounding box
+        self.ranges = {} # id(entity) -> (i0, j0, i1, j1), the cells the entity is registered in, or None if it is large
+        self.order = {} # id(entity) -> insertion counter, used to report each pair of movable entities once
+        self.large = {}
+        self.counter = 0
+
+    def __len__(self) -> int:
+        return len(self.entities)
+
+    def __contains__(self, entity: 'Entity') -> bool:
+        return id(entity) in self.entities
+
+    def _cell_range(self, box: tuple) -> tuple:
+        s = self.cell_size
+        return (math.floor(box[0] / s), math.floor(box[1] / s), math.floor(box[2] / s), math.floor(box[3] / s))
+
+    def _register(self, key: int, entity: 'Entity', cell_range: tuple):
+        i0, j0, i1, j1 = cell_range
+        if (i1 - i0 + 1) * (j1 - j0 + 1) > self.max_cells:
+            self.ranges[key] = None
+            self.large[key] = entity
+            return
+        self.ranges[key] = cell_range
+        for i in range(i0, i1 + 1):
+            for j in range(j0, j1 + 1):
+                cell = self.cells.get((i, j))
+                if cell is None:
+                    self.cells[(i, j)] = {key: entity}
+                else:
+                    cell[key] = entity
+
+    def _unregister(self, key: int):
+        cell_range = self.ranges[key]
+        if cell_range is None:
+            del self.large[key]
+            return
+        i0, j0, i1, j1 = cell_range
+        for i in range(i0, i1 + 1):
+            for j in range(j0, j1 + 1):
+                cell = self.cells[(i, j)]
+                del cell[key]
+                if not cell: del self.cells[(i, j)]
+
+    def insert(self, entity: 'Entity', box: tuple = None):
+        # box is the bounding box to register the entity with, by default the bounding box of its geometry
+        key = id(entity)
+        if key in self.entities: return
+        if box is None: box = bounding_box(entity)
+        self.entities[key] = entity
+        self.boxes[key] = box
+        self.order[key] = self.counter
+        self.counter += 1
+        self._register(key, entity, self._cell_range(box))
+
+    def remove(self, entity: 'Entity'):
+        key = id(entity)
+        if key not in self.entities: return
+        self._unregister(key)
+        del self.entities[key], self.boxes[key], self.ranges[key], self.order[key]
+
+    def update(self, entity: 'Entity', box: tuple = None):
+        # Call this after the entity moves. The cells are only touched if the entity moved into a different set of cells.
+        key = id(entity)
+        if box is None: box = bounding_box(entity)
+        self.boxes[key] = box
+        cell_range = self._cell_range(box)
+        if cell_range != self.ranges[key]:
+            self._unregister(key)
+            self._register(key, entity, cell_range)
+
+    def query(self, box: tuple) -> list:
+        # Returns the entities whose bounding boxes overlap with the given box
+        result = {}
+        i0, j0, i1, j1 = self._cell_range(box)
+        if (i1 - i0 + 1) * (j1 - j0 + 1) > self.max_cells:
+            candidates = [self.entities]
+        else:
+            candidates = [self.cells[(i, j)] for i in range(i0, i1 + 1) for j in range(j0, j1 + 1) if (i, j) in self.cells]
+            candidates.append(self.large)
+        for cell in candidates:
+            for key, entity in cell.items():
+                if key not in result and aabbOverlap(box, self.boxes[key]):
+                    result[key] = entity
+        return list(result.values())
+
+    def pairs(self) -> list:
+        # Returns the candidate (entity, entity) pairs whose bounding boxes overlap. At least one entity in each pair is movable: pairs of
+        # two static entities are never reported, because they cannot start colliding.
+        result = []
+        for key, entity in self.entities.items():
+            if not entity.movable: continue
+            order = self.order[key]
+            box = self.boxes[key]
+            cell_range = self.ranges[key]
+            if cell_range is None:
+                candidates = [self.entities]
+            else:
+                i0, j0, i1, j1 = cell_range
+                candidates = [self.cells[(i, j)] for i in range(i0, i1 + 1) for j in range(j0, j1 + 1)]
+                candidates.append(self.large)
+            seen = set()
+            for cell in candidates:
+                for other_key, other in cell.items():
+                    if other_key == key or other_key in seen: continue
+                    seen.add(other_key)
+                    if other.movable: # make sure the pair is reported only from one of the two entities
+                        other_is_large = self.ranges[other_key] is None
+                        if other_is_large != (cell_range is None):
+                            if other_is_large: continue
+                        elif self.order[other_key] < order: continue
+                    if aabbOverlap(box, self.boxes[other_key]):
+                        result.append((entity, other))
+        return result
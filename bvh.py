@@ -0,0 +1,91 @@
+import heapq
+import math
+import numpy as np
+from broadphase import bounding_box
+from geometry import aabbOverlap
+
+
+def box_distance(a: tuple, b: tuple) -> float:
+    # Distance between two axis-aligned boxes given as (xmin, ymin, xmax, ymax). This is a lower bound for the distance between anything
+    # inside them.
+    dx = max(a[0] - b[2], b[0] - a[2], 0.)
+    dy = max(a[1] - b[3], b[1] - a[3], 0.)
+    return math.hypot(dx, dy)
+
+
+class StaticBVH:
+    # A bounding volume hierarchy over entities that do not move. It is built once (by splitting the entities at the median of their
+    # bounding box centers along the longer axis, recursively) and then answers overlap and nearest-entity queries by descending only
+    # into the nodes whose boxes can matter, i.e. in logarithmic instead of linear time. If the set of entities changes, build it again.
+    def __init__(self, entities: list = [], leaf_size: int = 4):
+        self.leaf_size = leaf_size
+        self.build(entities)
+
+    def __len__(self) -> int:
+        return len(self.entities)
+
+    def build(self, entities: list):
+        self.entities = list(entities)
+        self.entity_boxes = [bounding_box(entity) for entity in self.entities]
+        self.node_boxes = [] # the box of node k is node_boxes[k]
+        self.children = [] # (left, right) node ids for inner nodes, None for leaves
+        self.leaves = [] # entity ids for leaves, None for inner nodes
+        if self.entities:
+            self._build(np.arange(len(self.entities)), np.array(self.entity_boxes, dtype=np.float64))
+
+    def _build(self, ids: np.ndarray, boxes: np.ndarray) -> int:
+        node = len(self.node_boxes)
+        node_box = boxes[ids]
+        self.node_boxes.append((node_box[:,0].min(), node_box[:,1].min(), node_box[:,2].max(), node_box[:,3].max()))
+        self.children.append(None)
+        self.leaves.append(None)
+        if len(ids) <= self.leaf_size:
+            self.leaves[node] = ids.tolist()
+            return node
+
+        centers = (node_box[:,:2] + node_box[:,2:]) / 2.
+        axis = np.argmax(centers.max(axis=0) - centers.min(axis=0))
+        order = np.argsort(centers[:,axis], kind='stable')
+        half = len(ids) // 2
+        left = self._build(ids[order[:half]], boxes)
+        right = self._build(ids[order[half:]], boxes)
+        self.children[node] = (left, right)
+        return node
+
+    def query(self, box: tuple) -> list:
+        # Returns the entities whose bounding boxes overlap with the given box
+        result = []
+        if not self.entities: return result
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            if not aabbOverlap(box, self.node_boxes[node]): continue
+            if self.leaves[node] is None:
+                stack.extend(self.children[node])
+            else:
+                for i in self.leaves[node]:
+                    if aabbOverlap(box, self.entity_boxes[i]):
+                        result.append(self.entities[i])
+        return result
+
+    def nearest(self, entity: 'Entity', max_distance: float = np.inf) -> tuple:
+        # Returns (nearest entity, its distance to the given entity), or (None, max_distance) if there is nothing closer than max_distance.
+        # The nodes are visited in the order of their box distances, and the search stops when no box can contain anything closer.
+        best, best_distance = None, max_distance
+        if not self.entities: return best, best_distance
+        box = bounding_box(entity)
+        heap = [(box_distance(box, self.node_boxes[0]), 0)]
+        while heap:
+            lower_bound, node = heapq.heappop(heap)
+            if lower_bound >= best_distance: break
+            if self.leaves[node] is None:
+                for child in self.children[node]:
+                    heapq.heappush(heap, (box_distance(box, self.node_boxes[child]), child))
+            else:
+                for i in self.leaves[node]:
+                    other = self.entities[i]
+                    if other is entity or box_distance(box, self.entity_boxes[i]) >= best_distance: continue
+                    d = entity.distanceTo(other)
+                    if d < best_distance:
+                        best, best_distance = other, d
+        return best, best_distance
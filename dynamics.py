@@ -0,0 +1,147 @@
+import numpy as np
+from geometry import Point
+
+
+def bicycle_step(center: np.ndarray, heading: np.ndarray, speed: np.ndarray, inputSteering: np.ndarray, inputAcceleration: np.ndarray,
+                 friction: np.ndarray, lr: np.ndarray, min_speed: np.ndarray, max_speed: np.ndarray, dt: float):
+    # This is the kinematic bicycle model of Entity.tick, written over arrays so that a whole batch of entities can be advanced at once.
+    # center is N x 2, everything else is either of length N or a scalar. Returns the new center, heading, velocity, acceleration
+    # and angular velocity with the same conventions as Entity.tick.
+    lf = lr # we assume the center of mass is the same as the geometric center of the entity
+    beta = np.arctan(lr / (lf + lr) * np.tan(inputSteering))
+
+    new_angular_velocity = speed * inputSteering
+    new_acceleration = inputAcceleration - friction
+    new_speed = np.clip(speed + new_acceleration * dt, min_speed, max_speed)
+    new_heading = heading + ((speed + new_speed)/lr)*np.sin(beta)*dt/2.
+    angle = (heading + new_heading)/2. + beta
+    travel = (speed + new_speed)*dt / 2.
+    new_center = center + np.stack([travel*np.cos(angle), travel*np.sin(angle)], axis=-1)
+    new_velocity = np.stack([new_speed*np.cos(new_heading), new_speed*np.sin(new_heading)], axis=-1)
+
+    return new_center, np.mod(new_heading, 2*np.pi), new_velocity, new_acceleration, new_angular_velocity
+
+
+def substep_counts(speed: np.ndarray, inputSteering: np.ndarray, inputAcceleration: np.ndarray, friction: np.ndarray, lr: np.ndarray,
+                   min_speed: np.ndarray, max_speed: np.ndarray, dt: float, tolerance: float, max_substeps: int = 64) -> np.ndarray:
+    # The number of equal steps to split a tick of dt into, so that the position error of bicycle_step stays below tolerance (meters).
+    # Within a step the steering is constant, so the exact path is an arc, and bicycle_step moves along its chord by the arc length L. If
+    # the heading turns by dpsi, the error is about L*dpsi^2/24. The other error comes from reaching min_speed or max_speed within the
+    # step, where the average of the two speeds is used for the whole step: it is at most |a|*dt^2/2. Both become n^2 times smaller with
+    # n steps. So going straight at a steady speed needs a single step however large dt is, sharp turns at high speed need more.
+    beta = np.arctan(0.5 * np.tan(inputSteering))
+    acceleration = np.abs(inputAcceleration - friction)
+    travel = (np.abs(speed) + 0.5 * acceleration * dt) * dt
+    turn = travel * np.abs(np.sin(beta)) / lr
+    unclipped_speed = speed + (inputAcceleration - friction) * dt
+    clipped = (unclipped_speed < min_speed) | (unclipped_speed > max_speed)
+    error = travel * turn**2 / 24. + np.where(clipped, acceleration * dt**2 / 2., 0.)
+    return np.clip(np.ceil(np.sqrt(error / tolerance)), 1, max_substeps).astype(int)
+
+
+class BatchedAttribute:
+    # A data descriptor for the Entity attributes that an AgentBatch can hold. As long as the entity is not part of a batch, the value
+    # lives in the entity's __dict__ (under a private name). Once the entity is added to a batch, it is read from and written to the
+    # corresponding row of the batch arrays, so the entity becomes a view into the batch.
+    # Note that Point-valued attributes (center, velocity) are returned as new Point objects for batched entities: modifying them in
+    # place (e.g. car.center.x = 3) does not change the batch, assign a new Point instead.
+    def __init__(self, point: bool = False, pose: bool = False):
+        self.point = point
+        self.pose = pose # if True, setting it changes the entity's pose version (see Entity.pose_version)
+
+    def __set_name__(self, owner, name: str):
+        self.name = name
+        self.private = '_' + name
+
+    def __get__(self, entity, owner = None):
+        if entity is None: return self
+        batch = entity._batch
+        if batch is None:
+            try:
+                return entity.__dict__[self.private]
+            except KeyError:
+                raise AttributeError(self.name) from None
+        value = getattr(batch, self.name)[entity._batch_index]
+        return Point(value[0], value[1]) if self.point else float(value)
+
+    def __set__(self, entity, value):
+        if self.pose: entity._pose_changed()
+        batch = entity._batch
+        if batch is None:
+            entity.__dict__[self.private] = value
+        elif self.point:
+            getattr(batch, self.name)[entity._batch_index] = [value.x, value.y]
+        else:
+            getattr(batch, self.name)[entity._batch_index] = value
+
+
+class AgentBatch:
+    # Struct-of-arrays storage for the movable entities of a World. The state, the controls and the parameters of every entity are kept
+    # in contiguous NumPy arrays, and tick() advances all of them with a single vectorized bicycle model update.
+    attributes = ['center', 'heading', 'velocity', 'acceleration', 'angular_velocity', 'inputSteering', 'inputAcceleration',
+                  'friction', 'max_speed', 'min_speed']
+
+    def __init__(self, capacity: int = 64):
+        self.entities = []
+        self.version = 0 # incremented whenever the arrays are modified directly (not through the entities), e.g. by tick
+        self._allocate(capacity)
+
+    def _allocate(self, capacity: int):
+        n = len(self.entities)
+        for name in self.attributes + ['rear_dist']:
+            shape = (capacity, 2) if name in ['center', 'velocity'] else (capacity,)
+            new_array = np.zeros(shape, dtype=np.float64)
+            if n > 0: new_array[:n] = getattr(self, name)[:n]
+            setattr(self, name, new_array)
+        self.capacity = capacity
+
+    def __len__(self) -> int:
+        return len(self.entities)
+
+    def add(self, entity: 'Entity'):
+        assert entity.movable and entity._batch is None
+        n = len(self.entities)
+        if n == self.capacity:
+            self._allocate(2*self.capacity)
+        values = [getattr(entity, name) for name in self.attributes]
+        self.rear_dist[n] = entity.rear_dist
+        entity._batch = self
+        entity._batch_index = n
+        self.entities.append(entity)
+        for name, value in zip(self.attributes, values):
+            setattr(entity, name, value) # this now goes to the arrays
+
+    def clear(self):
+        # Detaches all entities (they keep their latest state) and empties the batch
+        for entity in self.entities:
+            values = [getattr(entity, name) for name in self.attributes]
+            entity._batch = None
+            del entity._batch_index
+            for name, value in zip(self.attributes, values):
+                setattr(entity, name, value)
+        self.entities = []
+
+    def tick(self, dt: float, substeps: np.ndarray = None):
+        # If substeps (N integers, e.g. from substep_counts) is given, the tick of each entity is split into that many equal steps
+        n = len(self.entities)
+        if n == 0: return
+        if substeps is None:
+            self._step(slice(0, n), dt)
+        else:
+            for k in range(int(substeps.max())):
+                rows = np.flatnonzero(substeps > k)
+                self._step(rows, dt / substeps[rows])
+        self.version += 1
+
+    def _step(self, rows, dt):
+        # Advances the given rows (a slice or an index array) by dt (a scalar or one per row)
+        velocity = self.velocity[rows]
+        speed = np.sqrt(velocity[:,0]**2 + velocity[:,1]**2)
+        new_center, new_heading, new_velocity, new_acceleration, new_angular_velocity = bicycle_step(
+            self.center[rows], self.heading[rows], speed, self.inputSteering[rows], self.inputAcceleration[rows],
+            self.friction[rows], self.rear_dist[rows], self.min_speed[rows], self.max_speed[rows], dt)
+        self.center[rows] = new_center
+        self.heading[rows] = new_heading
+        self.velocity[rows] = new_velocity
+        self.acceleration[rows] = new_acceleration
+        self.angular_velocity[rows] = new_angular_velocity
@@ -1,10 +1,65 @@
 import numpy as np
-from geometry import Point, Rectangle, Circle, Ring
+from geometry import Point, PointArray, Rectangle, Circle, Ring
+from dynamics import BatchedAttribute
+from jit import bicycle_update
 from typing import Union
 import copy
 
 
+class PoseAttribute:
+    # An attribute that changes the entity's pose version when it is set, like center and heading. It is used for the shape parameters.
+    # These also determine the entity's rear_dist, which an AgentBatch keeps in an array, so the batch is updated as well.
+    def __set_name__(self, owner, name: str):
+        self.name = name
+        self.private = '_' + name
+
+    def __get__(self, entity, owner = None):
+        if entity is None: return self
+        try:
+            return entity.__dict__[self.private]
+        except KeyError:
+            raise AttributeError(self.name) from None
+
+    def __set__(self, entity, value):
+        entity._pose_changed()
+        entity.__dict__[self.private] = value
+        if entity._batch is not None:
+            entity._batch.rear_dist[entity._batch_index] = entity.rear_dist
+
+
+class PoseCache:
+    # The quantities that are derived from the pose of an entity and needed by the geometry, the kernels, the sensors and the renderers:
+    # the center as an array, the cosine and the sine of the heading, and for a RectangleEntity the edge centers and the corners (4 x 2).
+    # The arrays are read-only, because they are shared by everything that reads them until the pose changes (see Entity.pose_cache).
+    __slots__ = ('center', 'cos', 'sin', 'edge_centers', 'corners')
+
+    def __init__(self, center: Point, heading: float):
+        self.center = np.array([center.x, center.y], dtype=np.float64)
+        self.center.flags.writeable = False
+        self.cos = np.cos(heading)
+        self.sin = np.sin(heading)
+        self.edge_centers = None
+        self.corners = None
+
+
 class Entity:
+    # These can be backed by the arrays of an AgentBatch (see dynamics.py) when the World is batched
+    center = BatchedAttribute(point = True, pose = True)
+    heading = BatchedAttribute(pose = True)
+    velocity = BatchedAttribute(point = True)
+    acceleration = BatchedAttribute()
+    angular_velocity = BatchedAttribute()
+    inputSteering = BatchedAttribute()
+    inputAcceleration = BatchedAttribute()
+    friction = BatchedAttribute()
+    max_speed = BatchedAttribute()
+    min_speed = BatchedAttribute()
+    _batch = None
+    _pose_version = 0
+    _geometry_version = None
+    _pose_cache_version = None
+    _pose_listener = None # a dict that the entity adds itself to when its pose changes, set by the World it is in (see World.add)
+
     def __init__(self, center: Point, heading: float, movable: bool = True, friction: float = 0):
         self.center = center # this is x, y
         self.heading = heading
@@ -44,23 +99,14 @@ class Entity:
     
     def tick(self, dt: float):
         if self.movable:
-            speed = self.speed
-            heading = self.heading
-        
             # Kinematic bicycle model dynamics based on
             # "Kinematic and Dynamic Vehicle Models for Autonomous Driving Control Design" by
             # Jason Kong, Mark Pfeiffer, Georg Schildbach, Francesco Borrelli
-            lr = self.rear_dist
-            lf = lr # we assume the center of mass is the same as the geometric center of the entity
-            beta = np.arctan(lr / (lf + lr) * np.tan(self.inputSteering))
-            
-            new_angular_velocity = speed * self.inputSteering # this is not needed and used for this model, but let's keep it for consistency (and to avoid if-else statements)
-            new_acceleration = self.inputAcceleration - self.friction
-            new_speed = np.clip(speed + new_acceleration * dt, self.min_speed, self.max_speed)
-            new_heading = heading + ((speed + new_speed)/lr)*np.sin(beta)*dt/2.
-            angle = (heading + new_heading)/2. + beta
-            new_center = self.center + (speed + new_speed)*Point(np.cos(angle), np.sin(angle))*dt / 2.
-            new_velocity = Point(new_speed * np.cos(new_heading), new_speed * np.sin(new_heading))
+            # The update itself is jit.bicycle_update, which is compiled if Numba is installed.
+            center = self.center
+            x, y, new_heading, xp, yp, new_acceleration, new_angular_velocity = bicycle_update(
+                center.x, center.y, self.heading, self.speed, self.inputSteering, self.inputAcceleration, self.friction, self.rear_dist,
+                self.min_speed, self.max_speed, dt)
             
             '''
             # Point-mass dynamics based on
@@ -80,13 +126,46 @@ class Entity:
             
             '''
             
-            self.center = new_center
-            self.heading = np.mod(new_heading, 2*np.pi) # wrap the heading angle between 0 and +2pi
-            self.velocity = new_velocity
+            self.center = Point(x, y)
+            self.heading = new_heading # this is wrapped between 0 and +2pi
+            self.velocity = Point(xp, yp)
             self.acceleration = new_acceleration
             self.angular_velocity = new_angular_velocity
-            
+    
+    def _pose_changed(self):
+        self._pose_version += 1
+        if self._pose_listener is not None: self._pose_listener[id(self)] = self
+    
+    @property
+    def pose_version(self):
+        # This changes whenever the center, the heading or the size of the entity is set. Modifying them in place (e.g. car.center.x = 3)
+        # is not detected, so assign new values instead.
+        return self._pose_version if self._batch is None else (self._pose_version, self._batch.version)
+    
+    @property
+    def pose_cache(self) -> PoseCache:
+        # Like the geometry, this is computed on first access and reused until the pose version changes
+        version = self.pose_version
+        if self._pose_cache_version != version:
+            self._pose_cache = self.computePose()
+            self._pose_cache_version = version
+        return self._pose_cache
+    
+    def computePose(self) -> PoseCache:
+        return PoseCache(self.center, self.heading)
+    
+    @property
+    def obj(self):
+        # The geometry is only built when it is needed, and then it is reused until the pose of the entity changes. So ticks without any
+        # collision or distance queries do not spend time on it.
+        if self._geometry_version != self.pose_version:
             self.buildGeometry()
+        return self._obj
+    
+    @obj.setter
+    def obj(self, value):
+        self._obj = value
+        self._geometry_version = self.pose_version
     
     def buildGeometry(self): # builds the obj
         raise NotImplementedError
@@ -106,7 +185,22 @@ class Entity:
         raise NotImplementedError
         
     def copy(self):
-        return copy.deepcopy(self)
+        # The geometry objects are never modified in place (they are rebuilt when the entity moves), so the copy can share them and a
+        # shallow copy is enough. Only the points of the state are duplicated, in case they are modified in place.
+        new = copy.copy(self)
+        new.__dict__.pop('_pose_listener', None) # the copy is not part of the world
+        new.center = Point(self.center.x, self.center.y)
+        if self.movable:
+            new.velocity = Point(self.velocity.x, self.velocity.y)
+        return new
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self._batch is not None: # copies (and pickles) are detached from the batch
+            del state['_batch'], state['_batch_index']
+            for name in self._batch.attributes:
+                state['_' + name] = getattr(self, name)
+        return state
         
     @property
     def x(self):
@@ -125,54 +219,60 @@ class Entity:
         return self.velocity.y
     
 class RectangleEntity(Entity):
+    size = PoseAttribute()
+    
     def __init__(self, center: Point, heading: float, size: Point, movable: bool = True, friction: float = 0):
         super(RectangleEntity, self).__init__(center, heading, movable, friction)
         self.size = size
-        self.buildGeometry()
+    
+    def computePose(self) -> PoseCache:
+        pose = super(RectangleEntity, self).computePose()
+        x, y = pose.center
+        c, s = pose.cos, pose.sin
+        w, h = self.size.x / 2., self.size.y / 2.
+        pose.edge_centers = np.array([[x + w*c, y + w*s],
+                                      [x - h*s, y + h*c],
+                                      [x - w*c, y - w*s],
+                                      [x + h*s, y - h*c]], dtype=np.float64)
+        pose.corners = np.roll(pose.edge_centers, -1, axis=0) + pose.edge_centers - pose.center
+        pose.edge_centers.flags.writeable = False
+        pose.corners.flags.writeable = False
+        return pose
     
     @property
-    def edge_centers(self):
-        edge_centers = np.zeros((4,2), dtype=np.float32)
-        x = self.center.x
-        y = self.center.y
-        w = self.size.x
-        h = self.size.y
-        edge_centers[0] = [x + w / 2. * np.cos(self.heading), y + w / 2. * np.sin(self.heading)]
-        edge_centers[1] = [x - h / 2. * np.sin(self.heading), y + h / 2. * np.cos(self.heading)]
-        edge_centers[2] = [x - w / 2. * np.cos(self.heading), y - w / 2. * np.sin(self.heading)]
-        edge_centers[3] = [x + h / 2. * np.sin(self.heading), y - h / 2. * np.cos(self.heading)]
-        return edge_centers
+    def edge_centers(self) -> np.ndarray: # 4 x 2
+        return self.pose_cache.edge_centers
+        
+    @property
+    def corners_array(self) -> np.ndarray: # 4 x 2
+        return self.pose_cache.corners
         
     @property
     def corners(self):
-        ec = self.edge_centers
-        c = np.array([self.center.x, self.center.y])
-        corners = []
-        corners.append(Point(*(ec[1] + ec[0] - c)))
-        corners.append(Point(*(ec[2] + ec[1] - c)))
-        corners.append(Point(*(ec[3] + ec[2] - c)))
-        corners.append(Point(*(ec[0] + ec[3] - c)))
-        return corners
+        return PointArray(self.corners_array).toPoints()
         
     def buildGeometry(self):
         C = self.corners
         self.obj = Rectangle(*C[:-1])
         
 class CircleEntity(Entity):
+    radius = PoseAttribute()
+    
     def __init__(self, center: Point, heading: float, radius: float, movable: bool = True, friction: float = 0):
         super(CircleEntity, self).__init__(center, heading, movable, friction)
         self.radius = radius
-        self.buildGeometry()
         
     def buildGeometry(self):
         self.obj = Circle(self.center, self.radius)
                     
 class RingEntity(Entity):
+    inner_radius = PoseAttribute()
+    outer_radius = PoseAttribute()
+    
     def __init__(self, center: Point, heading: float, inner_radius: float, outer_radius: float, movable: bool = True, friction: float = 0):
         super(RingEntity, self).__init__(center, heading, movable, friction)
         self.inner_radius = inner_radius
         self.outer_radius = outer_radius
-        self.buildGeometry()
         
     def buildGeometry(self):
         self.obj = Ring(self.center, self.inner_radius, self.outer_radius)
\ No newline at end of file
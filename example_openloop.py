@@ -2,7 +2,6 @@ import numpy as np
 from world import World
 from agents import Car, RectangleBuilding, Painting, CircleBuilding
 from geometry import Point
-import time
 from interactive_controllers import OpenLoopController
 
 dt = 0.1  # time steps in terms of seconds. In other words, 1/dt is the FPS.
@@ -117,15 +116,15 @@ controller = OpenLoopController(my_controller, world=w)
 
 
 # Run the simulation with the open-loop controller
-for k in range(1200):
+def step(world):
+    # This is called before every tick. Returning False stops the simulation.
+    if world.collision_exists():
+        print(f'Collision at time t={world.t:.2f}s!')
+        return False
     c1.set_control(controller.steering, controller.throttle)
-    w.tick()  # This ticks the world for one time step (dt second)
-    w.render()
-    time.sleep(dt/4)  # Let's watch it 4x
-    
-    if w.collision_exists():
-        print(f'Collision at time t={w.t:.2f}s!')
-        import sys
-        sys.exit(0)
+
+# w.run ticks the world (dt seconds per tick) at a fixed rate and renders it when there is time for it. Let's watch it 4x.
+stats = w.run(1200, controller = step, real_time_factor = 4.)
+print(stats)
 
 w.close()
@@ -1,8 +1,11 @@
 import numpy as np
 from typing import Union
+import jit
 
 
 class Point:
+    __slots__ = ('x', 'y') # points are created all the time, so they don't get a __dict__
+    
     def __init__(self, x: float, y: float):
         self.x = float(x)
         self.y = float(y)
@@ -11,9 +14,11 @@ class Point:
         return 'Point(' + str(self.x) + ', ' + str(self.y) + ')'
         
     def __add__(self, other: 'Point') -> 'Point':
+        if isinstance(other, PointArray): return NotImplemented
         return Point(self.x + other.x, self.y + other.y)
         
     def __sub__(self, other: 'Point') -> 'Point':
+        if isinstance(other, PointArray): return NotImplemented
         return Point(self.x - other.x, self.y - other.y)
     
     def norm(self, p: int = 2) -> float:
@@ -31,6 +36,10 @@ class Point:
     def __truediv__(self, other: float) -> 'Point':
         return self.__mul__(1./other)
         
+    @property
+    def aabb(self) -> tuple:
+        return (self.x, self.y, self.x, self.y)
+        
         
     def isInside(self, other: Union['Line', 'Rectangle', 'Circle', 'Ring']) -> bool:
         if isinstance(other, Line):
@@ -75,11 +84,7 @@ class Point:
             return (self - other).norm(p = 2)
     
         elif isinstance(other, Line):
-            # Based on https://math.stackexchange.com/a/330329
-            s2_minus_s1 = other.p2 - other.p1
-            that = (self - other.p1).dot(s2_minus_s1) / s2_minus_s1.dot(s2_minus_s1)
-            tstar = np.minimum(1, np.maximum(0, that))
-            return (other.p1 + tstar * s2_minus_s1 - self).norm(p = 2)
+            return jit.point_segment_distance(self.x, self.y, other.p1.x, other.p1.y, other.p2.x, other.p2.y)
         
         elif isinstance(other, Rectangle):
             if self.isInside(other): return 0
@@ -91,7 +96,7 @@ class Point:
             
         elif isinstance(other, Ring):
             d = self.distanceTo(other.m)
-            return np.max([r_inner - d, d - r_outer, 0])
+            return np.max([other.r_inner - d, d - other.r_outer, 0])
             
         else:
             try:
@@ -101,13 +106,127 @@ class Point:
             print('Something went wrong!')
             raise
         
+class PointArray:
+    # N points stored in one N x 2 array, with the same arithmetic as Point but over all of them at once. Operands can be another
+    # PointArray of the same length (elementwise), a single Point (broadcast), or scalars / length-N arrays for * and /.
+    __slots__ = ('xy',)
+    __array_ufunc__ = None # so that e.g. ndarray * PointArray is handled by PointArray.__rmul__
+    
+    def __init__(self, xy: np.ndarray):
+        self.xy = np.asarray(xy, dtype=np.float64).reshape(-1, 2)
+        
+    @staticmethod
+    def fromPoints(points: list) -> 'PointArray':
+        return PointArray([(p.x, p.y) for p in points])
+        
+    def toPoints(self) -> list:
+        return [Point(x, y) for x, y in self.xy.tolist()]
+        
+    def __str__(self):
+        return 'PointArray(' + str(self.xy.tolist()) + ')'
+        
+    def __len__(self) -> int:
+        return len(self.xy)
+        
+    def __getitem__(self, i: int) -> Point:
+        return Point(self.xy[i,0], self.xy[i,1])
+        
+    def __iter__(self):
+        return iter(self.toPoints())
+        
+    @property
+    def x(self) -> np.ndarray:
+        return self.xy[:,0]
+        
+    @property
+    def y(self) -> np.ndarray:
+        return self.xy[:,1]
+        
+    @staticmethod
+    def _coordinates(other: Union['Point', 'PointArray']) -> np.ndarray:
+        return other.xy if isinstance(other, PointArray) else np.array([other.x, other.y])
+        
+    def __add__(self, other: Union['Point', 'PointArray']) -> 'PointArray':
+        return PointArray(self.xy + self._coordinates(other))
+        
+    def __radd__(self, other: 'Point') -> 'PointArray':
+        return self.__add__(other)
+        
+    def __sub__(self, other: Union['Point', 'PointArray']) -> 'PointArray':
+        return PointArray(self.xy - self._coordinates(other))
+        
+    def __rsub__(self, other: 'Point') -> 'PointArray':
+        return PointArray(self._coordinates(other) - self.xy)
+        
+    def __mul__(self, other: Union[float, np.ndarray]) -> 'PointArray':
+        return PointArray(self.xy * np.reshape(other, (-1, 1)))
+        
+    def __rmul__(self, other: Union[float, np.ndarray]) -> 'PointArray':
+        return self.__mul__(other)
+        
+    def __truediv__(self, other: Union[float, np.ndarray]) -> 'PointArray':
+        return PointArray(self.xy / np.reshape(other, (-1, 1)))
+        
+    def norm(self, p: int = 2) -> np.ndarray:
+        return np.linalg.norm(self.xy, ord=p, axis=1)
+        
+    def dot(self, other: Union['Point', 'PointArray']) -> np.ndarray:
+        return self.xy @ self._coordinates(other) if isinstance(other, Point) else np.sum(self.xy * other.xy, axis=1)
+        
+    def distanceTo(self, other: Union['Point', 'PointArray', 'Line', 'Rectangle', 'Circle', 'Ring']) -> np.ndarray:
+        if isinstance(other, Point) or isinstance(other, PointArray):
+            return (self - other).norm(p = 2)
+            
+        elif isinstance(other, Line):
+            s2_minus_s1 = other.p2 - other.p1
+            that = (self - other.p1).dot(s2_minus_s1) / max(s2_minus_s1.dot(s2_minus_s1), 1e-12) # a zero length segment is a point
+            tstar = np.minimum(1, np.maximum(0, that))
+            return (PointArray(np.outer(tstar, [s2_minus_s1.x, s2_minus_s1.y])) + other.p1 - self).norm(p = 2)
+            
+        elif isinstance(other, Rectangle):
+            # Same as Point.isInside for the inside test, and the distance to the closest edge otherwise
+            AB, AM = other.c2 - other.c1, self - other.c1
+            BC, BM = other.c3 - other.c2, self - other.c2
+            inside = (0 <= AM.dot(AB)) & (AM.dot(AB) <= AB.dot(AB)) & (0 <= BM.dot(BC)) & (BM.dot(BC) <= BC.dot(BC))
+            d = np.min([self.distanceTo(e) for e in other.edges], axis=0)
+            return np.where(inside, 0., d)
+            
+        elif isinstance(other, Circle):
+            return np.maximum(0, self.distanceTo(other.m) - other.r)
+            
+        elif isinstance(other, Ring):
+            d = self.distanceTo(other.m)
+            return np.maximum.reduce([other.r_inner - d, d - other.r_outer, np.zeros_like(d)])
+            
+        raise NotImplementedError
+        
+        
+'''
+Axis-aligned bounding boxes are represented as (xmin, ymin, xmax, ymax) tuples. Every shape has one in its aabb attribute, and all
+intersectsWith checks start with cannotIntersect, which rejects pairs of shapes whose boxes do not overlap, or when one shape is completely
+inside the hole of a Ring. distanceTo benefits from this too, because it checks for an intersection first.
+'''
+def aabbOverlap(a: tuple, b: tuple) -> bool:
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+    
+def insideHole(box: tuple, ring: 'Ring') -> bool:
+    # the farthest point of the box from the center of the ring is closer than the inner radius
+    dx = max(abs(box[0] - ring.m.x), abs(box[2] - ring.m.x))
+    dy = max(abs(box[1] - ring.m.y), abs(box[3] - ring.m.y))
+    return dx*dx + dy*dy < ring.r_inner*ring.r_inner
+    
+def cannotIntersect(a: Union['Point', 'Line', 'Rectangle', 'Circle', 'Ring'], b: Union['Point', 'Line', 'Rectangle', 'Circle', 'Ring']) -> bool:
+    if not aabbOverlap(a.aabb, b.aabb): return True
+    if isinstance(b, Ring) and insideHole(a.aabb, b): return True
+    if isinstance(a, Ring) and insideHole(b.aabb, a): return True
+    return False
+        
 '''
 Given three colinear points p, q, r, the function checks if 
 point q lies on line segment 'pr' 
 '''
 def onSegment(p: Point, q: Point, r: Point) -> bool:
-    return (q.x <= np.maximum(p.x, r.x) and q.x >= np.minimum(p.x, r.x) and 
-        q.y <= np.maximum(p.y, r.y) and q.y >= np.minimum(p.y, r.y)) 
+    return jit.on_segment(p.x, p.y, q.x, q.y, r.x, r.y)
   
 '''
 To find orientation of ordered triplet (p, q, r). 
@@ -117,52 +236,30 @@ The function returns following values
 2 --> Counterclockwise 
 '''
 def orientation(p: Point, q: Point, r: Point) -> int:
-    # See https://www.geeksforgeeks.org/orientation-3-ordered-points/ for details of below formula. 
-    val = (q.y - p.y) * (r.x - q.x) - (q.x - p.x) * (r.y - q.y)
-    if val == 0: return 0 # colinear 
-    return 1 if val > 0 else 2 # clock or counterclock wise 
+    # See https://www.geeksforgeeks.org/orientation-3-ordered-points/ for details of the formula in jit.orientation
+    return jit.orientation(p.x, p.y, q.x, q.y, r.x, r.y)
         
         
 class Line:
     def __init__(self, p1: Point, p2: Point):
         self.p1 = p1
         self.p2 = p2
+        self._aabb = None # lines are created a lot (e.g. as edges), so the box is only computed when it is needed
+        
+    @property
+    def aabb(self) -> tuple:
+        if self._aabb is None:
+            self._aabb = (min(self.p1.x, self.p2.x), min(self.p1.y, self.p2.y), max(self.p1.x, self.p2.x), max(self.p1.y, self.p2.y))
+        return self._aabb
         
     def __str__(self):
         return 'Line(' + str(self.p1) +  ', ' + str(self.p2) + ')'
         
     def intersectsWith(self, other: Union['Line','Rectangle','Circle','Ring']):
+        if cannotIntersect(self, other): return False
         if isinstance(other, Line):
-            p1 = self.p1
-            q1 = self.p2
-            p2 = other.p1
-            q2 = other.p2
-        
-            # Based on https://www.geeksforgeeks.org/check-if-two-given-line-segments-intersect/
-            # Find the four orientations needed for general and special cases 
-            o1 = orientation(p1, q1, p2) 
-            o2 = orientation(p1, q1, q2) 
-            o3 = orientation(p2, q2, p1) 
-            o4 = orientation(p2, q2, q1)
-      
-            # General case 
-            if o1 != o2 and o3 != o4:
-                return True
-
-            # Special Cases 
-            # p1, q1 and p2 are colinear and p2 lies on segment p1q1 
-            if o1 == 0 and onSegment(p1, p2, q1): return True
-      
-            # p1, q1 and q2 are colinear and q2 lies on segment p1q1 
-            if o2 == 0 and onSegment(p1, q2, q1): return True
-      
-            # p2, q2 and p1 are colinear and p1 lies on segment p2q2
-            if o3 == 0 and onSegment(p2, p1, q2): return True
-      
-            # p2, q2 and q1 are colinear and q1 lies on segment p2q2
-            if o4 == 0 and onSegment(p2, q1, q2): return True
-      
-            return False # Doesn't fall in any of the above cases 
+            # Based on https://www.geeksforgeeks.org/check-if-two-given-line-segments-intersect/, see jit.segments_intersect
+            return jit.segments_intersect(self.p1.x, self.p1.y, self.p2.x, self.p2.y, other.p1.x, other.p1.y, other.p2.x, other.p2.y)
             
         elif isinstance(other, Rectangle):
             if self.p1.isInside(other) or self.p2.isInside(other): return True
@@ -198,7 +295,7 @@ class Line:
             
         elif isinstance(other, Line):
             if self.intersectsWith(other): return 0.
-            return np.min([self.p1.distanceTo(other.p1), self.p1.distanceTo(other.p2), self.p2.distanceTo(other.p1), self.p2.distanceTo(other.p2)])
+            return np.min([self.p1.distanceTo(other), self.p2.distanceTo(other), other.p1.distanceTo(self), other.p2.distanceTo(self)])
             
         elif isinstance(other, Rectangle):
             if self.intersectsWith(other): return 0.
@@ -225,6 +322,9 @@ class Rectangle:
         self.c2 = c2
         self.c3 = c3
         self.c4 = c3 + c1 - c2
+        xs = [self.c1.x, self.c2.x, self.c3.x, self.c4.x]
+        ys = [self.c1.y, self.c2.y, self.c3.y, self.c4.y]
+        self.aabb = (min(xs), min(ys), max(xs), max(ys))
         
     def __str__(self):
         return 'Rectangle(' + str(self.c1) +  ', ' + str(self.c2) +  ', ' + str(self.c3) +  ', ' + str(self.c4) + ')'
@@ -242,6 +342,7 @@ class Rectangle:
         return [self.c1, self.c2, self.c3, self.c4]
         
     def intersectsWith(self, other: Union['Line', 'Rectangle', 'Circle', 'Ring']) -> bool:
+        if cannotIntersect(self, other): return False
         if isinstance(other, Line):
             return other.intersectsWith(self)
             
@@ -249,6 +350,9 @@ class Rectangle:
             E = self.edges
             for e in E:
                 if e.intersectsWith(other): return True
+            # no edges intersect, but one of the shapes can still be completely inside the other
+            if isinstance(other, Rectangle): return self.c1.isInside(other) or other.c1.isInside(self)
+            if isinstance(other, Circle): return other.m.isInside(self)
             return False
 
         raise NotImplementedError
@@ -273,11 +377,13 @@ class Circle:
     def __init__(self, m: Point, r: float):
         self.m = m
         self.r = r
+        self.aabb = (m.x - r, m.y - r, m.x + r, m.y + r)
         
     def __str__(self):
         return 'Circle(' + str(self.m) +  ', radius = ' + str(self.r) + ')'
         
     def intersectsWith(self, other: Union['Line', 'Rectangle', 'Circle', 'Ring']):
+        if cannotIntersect(self, other): return False
         if isinstance(other, Line) or isinstance(other, Rectangle):
             return other.intersectsWith(self)
             
@@ -313,11 +419,13 @@ class Ring:
         assert r_inner < r_outer
         self.r_inner = r_inner
         self.r_outer = r_outer
+        self.aabb = (m.x - r_outer, m.y - r_outer, m.x + r_outer, m.y + r_outer)
         
     def __str__(self):
         return 'Ring(' + str(self.m) +  ', inner radius = ' + str(self.r_inner) +  ', outer radius = ' + str(self.r_outer) + ')'
         
     def intersectsWith(self, other: Union['Line', 'Rectangle', 'Circle', 'Ring']):
+        if cannotIntersect(self, other): return False
         if isinstance(other, Line) or isinstance(other, Rectangle) or isinstance(other, Circle):
             return other.intersectsWith(self)
             
@@ -338,6 +446,7 @@ class Ring:
             return other.distanceTo(self)
             
         if isinstance(other, Ring):
+            d = self.m.distanceTo(other.m)
             if d > self.r_outer + other.r_outer: return d - self.r_outer - other.r_outer # rings are far away
             if d + self.r_outer < other.r_inner: return other.r_inner - d - self.r_outer # self is completely inside other
             if d + other.r_outer < self.r_inner: return self.r_inner - d - other.r_outer # other is completely inside self
@@ -0,0 +1,76 @@
+import math
+import os
+
+# The scalar functions that dominate the per-entity code paths (the bicycle model in Entity.tick and the segment tests and distances in
+# geometry.py). They only use floats and the math module, so if Numba is installed they are compiled with numba.njit, and otherwise they
+# run as plain Python, which is still much faster than doing the same on NumPy scalars. Set the environment variable CARLO_JIT=0 to
+# use the plain Python versions even if Numba is installed (e.g. to avoid its import and compilation time in short scripts).
+try:
+    if os.environ.get('CARLO_JIT', '1') == '0': raise ImportError
+    from numba import njit
+    JIT_ENABLED = True
+except ImportError:
+    JIT_ENABLED = False
+
+    def njit(*args, **kwargs):
+        # Stands in for numba.njit, both as @njit and as @njit(...)
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda function: function
+
+
+@njit(cache=True)
+def bicycle_update(x: float, y: float, heading: float, speed: float, inputSteering: float, inputAcceleration: float, friction: float,
+                   lr: float, min_speed: float, max_speed: float, dt: float) -> tuple:
+    # One step of the kinematic bicycle model of Entity.tick (the same as dynamics.bicycle_step for a single entity). Returns the new
+    # x, y, heading (wrapped between 0 and 2pi), xp, yp, acceleration and angular velocity.
+    lf = lr # we assume the center of mass is the same as the geometric center of the entity
+    beta = math.atan(lr / (lf + lr) * math.tan(inputSteering))
+
+    new_angular_velocity = speed * inputSteering
+    new_acceleration = inputAcceleration - friction
+    new_speed = min(max(speed + new_acceleration * dt, min_speed), max_speed)
+    new_heading = heading + ((speed + new_speed)/lr)*math.sin(beta)*dt/2.
+    angle = (heading + new_heading)/2. + beta
+    travel = (speed + new_speed)*dt / 2.
+    return (x + travel*math.cos(angle), y + travel*math.sin(angle), new_heading % (2*math.pi),
+            new_speed*math.cos(new_heading), new_speed*math.sin(new_heading), new_acceleration, new_angular_velocity)
+
+
+@njit(cache=True)
+def orientation(px: float, py: float, qx: float, qy: float, rx: float, ry: float) -> int:
+    # 0 if p, q and r are colinear, 1 if they are clockwise, 2 if they are counterclockwise (see geometry.orientation)
+    val = (qy - py) * (rx - qx) - (qx - px) * (ry - qy)
+    if val == 0: return 0
+    return 1 if val > 0 else 2
+
+
+@njit(cache=True)
+def on_segment(px: float, py: float, qx: float, qy: float, rx: float, ry: float) -> bool:
+    # For colinear p, q and r, whether q lies on the segment pr (see geometry.onSegment)
+    return min(px, rx) <= qx <= max(px, rx) and min(py, ry) <= qy <= max(py, ry)
+
+
+@njit(cache=True)
+def segments_intersect(p1x: float, p1y: float, q1x: float, q1y: float, p2x: float, p2y: float, q2x: float, q2y: float) -> bool:
+    # Whether the segments p1q1 and p2q2 intersect, based on https://www.geeksforgeeks.org/check-if-two-given-line-segments-intersect/
+    o1 = orientation(p1x, p1y, q1x, q1y, p2x, p2y)
+    o2 = orientation(p1x, p1y, q1x, q1y, q2x, q2y)
+    o3 = orientation(p2x, p2y, q2x, q2y, p1x, p1y)
+    o4 = orientation(p2x, p2y, q2x, q2y, q1x, q1y)
+    if o1 != o2 and o3 != o4: return True # general case
+    # Special cases: three of the points are colinear and the third one lies on the segment of the other two
+    if o1 == 0 and on_segment(p1x, p1y, p2x, p2y, q1x, q1y): return True
+    if o2 == 0 and on_segment(p1x, p1y, q2x, q2y, q1x, q1y): return True
+    if o3 == 0 and on_segment(p2x, p2y, p1x, p1y, q2x, q2y): return True
+    if o4 == 0 and on_segment(p2x, p2y, q1x, q1y, q2x, q2y): return True
+    return False
+
+
+@njit(cache=True)
+def point_segment_distance(px: float, py: float, ax: float, ay: float, bx: float, by: float) -> float:
+    # Distance from p to the segment ab, based on https://math.stackexchange.com/a/330329
+    abx, aby = bx - ax, by - ay
+    squared_length = abx*abx + aby*aby
+    t = 0. if squared_length == 0 else min(1., max(0., ((px - ax)*abx + (py - ay)*aby) / squared_length))
+    return math.hypot(ax + t*abx - px, ay + t*aby - py)
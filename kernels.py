@@ -0,0 +1,257 @@
+import numpy as np
+from entities import RectangleEntity, CircleEntity, RingEntity
+
+# Vectorized geometry kernels. These work on NumPy arrays describing many shapes at once instead of on the objects in geometry.py, so
+# that checking e.g. a whole fleet of cars against each other is only a handful of array operations.
+#
+# An oriented rectangle is given by its center (x, y), its half size (half of the size along the heading, half of the size perpendicular
+# to it) and its heading, like a RectangleEntity.
+
+
+def rectangle_arrays(entities: list) -> tuple:
+    # Returns the centers (N x 2), half sizes (N x 2) and headings (N) of a list of RectangleEntity objects
+    state = np.array([(e.center.x, e.center.y, e.size.x, e.size.y, e.heading) for e in entities], dtype=np.float64).reshape(-1, 5)
+    return state[:,:2], state[:,2:4] / 2., state[:,4]
+
+
+def rectangle_corners(centers: np.ndarray, half_sizes: np.ndarray, headings: np.ndarray) -> np.ndarray:
+    # The corners (... x 4 x 2) of the rectangles, in the same order as RectangleEntity.corners_array
+    c, s = np.cos(headings)[...,None], np.sin(headings)[...,None]
+    w = half_sizes[...,0,None] * np.array([1., -1., -1., 1.])
+    h = half_sizes[...,1,None] * np.array([1., 1., -1., -1.])
+    return np.stack([centers[...,0,None] + w*c - h*s, centers[...,1,None] + w*s + h*c], axis=-1)
+
+
+def rectangles_overlap(centers1: np.ndarray, half_sizes1: np.ndarray, headings1: np.ndarray,
+                       centers2: np.ndarray, half_sizes2: np.ndarray, headings2: np.ndarray) -> np.ndarray:
+    # Separating axis test between the oriented rectangles 1 and 2, elementwise (with broadcasting). Two rectangles overlap unless their
+    # projections onto one of the four edge directions are disjoint. Touching rectangles overlap, and so do contained ones.
+    d = centers2 - centers1
+    cos1, sin1 = np.cos(headings1), np.sin(headings1)
+    cos2, sin2 = np.cos(headings2), np.sin(headings2)
+    w1, h1 = half_sizes1[...,0], half_sizes1[...,1]
+    w2, h2 = half_sizes2[...,0], half_sizes2[...,1]
+    c = np.abs(np.cos(headings2 - headings1))
+    s = np.abs(np.sin(headings2 - headings1))
+
+    overlap = np.abs(d[...,0]*cos1 + d[...,1]*sin1) <= w1 + w2*c + h2*s
+    overlap &= np.abs(-d[...,0]*sin1 + d[...,1]*cos1) <= h1 + w2*s + h2*c
+    overlap &= np.abs(d[...,0]*cos2 + d[...,1]*sin2) <= w2 + w1*c + h1*s
+    overlap &= np.abs(-d[...,0]*sin2 + d[...,1]*cos2) <= h2 + w1*s + h1*c
+    return overlap
+
+
+# Distance kernels. Rectangles are handled as convex polygons given by their corners (... x K x 2), circles by their centers and radii,
+# and rings by their centers and inner and outer radii. All of them broadcast over the leading dimensions. The distance between two
+# overlapping shapes is 0.
+
+def point_segment_distance(points: np.ndarray, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    # Distance from the points to the line segments from a to b
+    ab = b - a
+    ap = points - a
+    t = np.sum(ap*ab, axis=-1) / np.maximum(np.sum(ab*ab, axis=-1), 1e-12)
+    t = np.clip(t, 0., 1.)[...,None]
+    return np.linalg.norm(ap - t*ab, axis=-1)
+
+
+def points_in_polygons(points: np.ndarray, polygons: np.ndarray) -> np.ndarray:
+    # Whether the points (... x 2) are inside (or on the boundary of) the convex polygons (... x K x 2). A polygon without area (e.g. a
+    # segment given as 2 corners, or a single point) has no inside: every point on the line through it would pass the edge tests.
+    a = polygons
+    b = np.roll(polygons, -1, axis=-2)
+    p = points[...,None,:]
+    cross = (b[...,0] - a[...,0])*(p[...,1] - a[...,1]) - (b[...,1] - a[...,1])*(p[...,0] - a[...,0])
+    area = np.sum(a[...,0]*b[...,1] - a[...,1]*b[...,0], axis=-1) # twice the signed area
+    return (np.all(cross >= 0, axis=-1) | np.all(cross <= 0, axis=-1)) & (area != 0)
+
+
+def point_polygon_distance(points: np.ndarray, polygons: np.ndarray) -> np.ndarray:
+    # Distance from the points (... x 2) to the convex polygons (... x K x 2), which is 0 for the points inside
+    d = point_segment_distance(points[...,None,:], polygons, np.roll(polygons, -1, axis=-2)).min(axis=-1)
+    return np.where(points_in_polygons(points, polygons), 0., d)
+
+
+def polygons_overlap(polygons1: np.ndarray, polygons2: np.ndarray) -> np.ndarray:
+    # Separating axis test for convex polygons (... x K1 x 2 and ... x K2 x 2): they overlap unless their projections onto one of the edge
+    # normals are disjoint
+    edges1 = np.roll(polygons1, -1, axis=-2) - polygons1
+    edges2 = np.roll(polygons2, -1, axis=-2) - polygons2
+    shape = np.broadcast_shapes(edges1.shape[:-2], edges2.shape[:-2])
+    edges = np.concatenate([np.broadcast_to(edges1, shape + edges1.shape[-2:]), np.broadcast_to(edges2, shape + edges2.shape[-2:])], axis=-2)
+    axes = np.stack([-edges[...,1], edges[...,0]], axis=-1)
+    projections1 = np.sum(polygons1[...,:,None,:]*axes[...,None,:,:], axis=-1)
+    projections2 = np.sum(polygons2[...,:,None,:]*axes[...,None,:,:], axis=-1)
+    separated = (projections1.max(axis=-2) < projections2.min(axis=-2)) | (projections2.max(axis=-2) < projections1.min(axis=-2))
+    return ~np.any(separated, axis=-1)
+
+
+def convex_hulls(points: np.ndarray) -> np.ndarray:
+    # The convex hulls of N sets of M points (N x M x 2), as N x M x 2 arrays of counterclockwise polygon corners. A hull with fewer than
+    # M corners repeats its last corner to fill the row, and the polygon kernels above handle these zero-length edges like the hull.
+    N, M = points.shape[:2]
+    d = points[:,None,:,:] - points[:,:,None,:] # d[n, i, j] = p_j - p_i
+    cross = d[:,:,:,None,0]*d[:,:,None,:,1] - d[:,:,:,None,1]*d[:,:,None,:,0] # cross[n, i, j, k] = (p_j - p_i) x (p_k - p_i)
+    lengths = np.linalg.norm(d, axis=-1)
+    eps = 1e-9 * max(1., np.abs(points).max(initial=0.))
+    # i -> j is a hull edge if all points are on its left. Among the collinear ones, take the farthest to skip the points in between.
+    is_edge = np.all(cross >= -eps*np.maximum(lengths[...,None], 1.), axis=-1) & (lengths > eps)
+    successors = np.argmax(np.where(is_edge, lengths, -1.), axis=-1)
+    x, y = points[...,0], points[...,1]
+    current = np.argmin(np.where(x <= x.min(axis=1, keepdims=True), y, np.inf), axis=1) # the lowest of the leftmost points is a corner
+    rows = np.arange(N)
+    first = current
+    closed = np.zeros(N, dtype=bool)
+    hull = np.empty_like(points)
+    hull[:,0] = points[rows, current]
+    for m in range(1, M):
+        following = successors[rows, current]
+        closed |= following == first
+        current = np.where(closed, current, following) # stay at the last corner once the hull is closed
+        hull[:,m] = points[rows, current]
+    return hull
+
+
+def polygon_distance(polygons1: np.ndarray, polygons2: np.ndarray) -> np.ndarray:
+    # If two convex polygons do not overlap, the closest points are a vertex of one of them and a point on an edge of the other
+    a1, b1 = polygons1, np.roll(polygons1, -1, axis=-2)
+    a2, b2 = polygons2, np.roll(polygons2, -1, axis=-2)
+    d12 = point_segment_distance(polygons1[...,:,None,:], a2[...,None,:,:], b2[...,None,:,:]).min(axis=(-1,-2))
+    d21 = point_segment_distance(polygons2[...,:,None,:], a1[...,None,:,:], b1[...,None,:,:]).min(axis=(-1,-2))
+    return np.where(polygons_overlap(polygons1, polygons2), 0., np.minimum(d12, d21))
+
+
+def circle_distance(centers1: np.ndarray, radii1: np.ndarray, centers2: np.ndarray, radii2: np.ndarray) -> np.ndarray:
+    return np.maximum(0., np.linalg.norm(centers2 - centers1, axis=-1) - radii1 - radii2)
+
+
+def annulus_distance(min_distances: np.ndarray, max_distances: np.ndarray, inner_radii: np.ndarray, outer_radii: np.ndarray) -> np.ndarray:
+    # Distance from a ring to a shape whose points are between min_distances and max_distances away from the ring's center. For a
+    # connected shape, it is either completely in the hole, completely outside, or overlapping with the ring.
+    return np.where(max_distances < inner_radii, inner_radii - max_distances, np.maximum(0., min_distances - outer_radii))
+
+
+def ring_distance(centers1: np.ndarray, inner_radii1: np.ndarray, outer_radii1: np.ndarray,
+                  centers2: np.ndarray, inner_radii2: np.ndarray, outer_radii2: np.ndarray) -> np.ndarray:
+    d = np.linalg.norm(centers2 - centers1, axis=-1)
+    return np.select([d > outer_radii1 + outer_radii2, d + outer_radii1 < inner_radii2, d + outer_radii2 < inner_radii1],
+                     [d - outer_radii1 - outer_radii2, inner_radii2 - d - outer_radii1, inner_radii1 - d - outer_radii2], 0.)
+
+
+def shape_groups(entities: list) -> dict:
+    # Groups the entities by their shape. Returns {'polygon': (indices, corners), 'circle': (indices, centers, radii),
+    # 'ring': (indices, centers, inner radii, outer radii)}, where indices are the positions of the entities in the given list.
+    rows = {'polygon': [], 'circle': [], 'ring': []}
+    for i, e in enumerate(entities):
+        if isinstance(e, RectangleEntity):
+            rows['polygon'].append((i, e.corners_array))
+        elif isinstance(e, CircleEntity):
+            rows['circle'].append((i, (e.center.x, e.center.y), e.radius))
+        elif isinstance(e, RingEntity):
+            rows['ring'].append((i, (e.center.x, e.center.y), e.inner_radius, e.outer_radius))
+        else:
+            raise NotImplementedError
+    return {kind: tuple(np.array(column, dtype=(int if k == 0 else np.float64)) for k, column in enumerate(zip(*group)))
+            for kind, group in rows.items() if group}
+
+
+def shape_distances(kind1: str, shapes1: tuple, kind2: str, shapes2: tuple) -> np.ndarray:
+    # The distances between the shapes of two kinds (given like in shape_groups, without the indices), which broadcast against each other
+    order = ['polygon', 'circle', 'ring']
+    if order.index(kind1) > order.index(kind2):
+        return shape_distances(kind2, shapes2, kind1, shapes1)
+    first, second = shapes1, shapes2
+    if kind1 == 'polygon':
+        polygons = first[0]
+        if kind2 == 'polygon':
+            return polygon_distance(polygons, second[0])
+        point_distances = point_polygon_distance(second[0], polygons)
+        if kind2 == 'circle':
+            return np.maximum(0., point_distances - second[1])
+        max_distances = np.linalg.norm(polygons - second[0][...,None,:], axis=-1).max(axis=-1)
+        return annulus_distance(point_distances, max_distances, second[1], second[2])
+    if kind1 == 'circle':
+        if kind2 == 'circle':
+            return circle_distance(first[0], first[1], second[0], second[1])
+        d = np.linalg.norm(first[0] - second[0], axis=-1)
+        return annulus_distance(np.maximum(0., d - first[1]), d + first[1], second[1], second[2])
+    return ring_distance(first[0], first[1], first[2], second[0], second[1], second[2])
+
+
+def _group_distances(kind1: str, shapes1: tuple, kind2: str, shapes2: tuple) -> np.ndarray:
+    # The distances between all shapes of two groups, as an N1 x N2 array (without the indices)
+    return shape_distances(kind1, [x[:,None] for x in shapes1], kind2, [x[None] for x in shapes2])
+
+
+def distance_matrix(entities1: list, entities2: list = None, block_size: int = 64) -> np.ndarray:
+    # Returns the N1 x N2 matrix of distances between two lists of entities (or between the entities of one list). The entities are
+    # grouped by shape, and each pair of groups is computed in blocks of rows to bound the memory.
+    groups1 = shape_groups(entities1)
+    groups2 = groups1 if entities2 is None else shape_groups(entities2)
+    result = np.zeros((len(entities1), len(entities1 if entities2 is None else entities2)), dtype=np.float64)
+    for kind1, (indices1, *shapes1) in groups1.items():
+        for kind2, (indices2, *shapes2) in groups2.items():
+            for start in range(0, len(indices1), block_size):
+                block = [x[start:start+block_size] for x in shapes1]
+                result[np.ix_(indices1[start:start+block_size], indices2)] = _group_distances(kind1, block, kind2, shapes2)
+    return result
+
+
+# Ray casting kernels. Rays are given by their origins (R x 2) and unit directions (R x 2). They return the R x S distances along the
+# rays to the S shapes, which are np.inf if a ray does not hit a shape and 0 if the origin is inside a shape.
+
+def ray_segment_distance(origins: np.ndarray, directions: np.ndarray, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    e = (b - a)[None]
+    w = a[None] - origins[:,None]
+    d = directions[:,None]
+    denominator = d[...,0]*e[...,1] - d[...,1]*e[...,0]
+    parallel = np.abs(denominator) < 1e-12
+    denominator = np.where(parallel, 1., denominator)
+    t = (w[...,0]*e[...,1] - w[...,1]*e[...,0]) / denominator
+    u = (w[...,0]*d[...,1] - w[...,1]*d[...,0]) / denominator
+    return np.where(~parallel & (t >= 0) & (u >= 0) & (u <= 1), t, np.inf)
+
+
+def _ray_circle_roots(origins: np.ndarray, directions: np.ndarray, centers: np.ndarray, radii: np.ndarray) -> tuple:
+    # Returns the squared distances of the origins to the centers, and the two (possibly nan) distances along the rays where they cross
+    # the circles
+    oc = origins[:,None] - centers[None]
+    b = np.sum(oc*directions[:,None], axis=-1)
+    squared_distances = np.sum(oc*oc, axis=-1)
+    discriminant = b*b - squared_distances + radii[None]**2
+    root = np.sqrt(np.where(discriminant >= 0, discriminant, np.nan))
+    return squared_distances, -b - root, -b + root
+
+
+def ray_polygon_distance(origins: np.ndarray, directions: np.ndarray, polygons: np.ndarray) -> np.ndarray:
+    K = polygons.shape[1]
+    t = ray_segment_distance(origins, directions, polygons.reshape(-1, 2), np.roll(polygons, -1, axis=1).reshape(-1, 2))
+    t = t.reshape(len(origins), -1, K).min(axis=-1)
+    return np.where(points_in_polygons(origins[:,None], polygons[None]), 0., t)
+
+
+def ray_circle_distance(origins: np.ndarray, directions: np.ndarray, centers: np.ndarray, radii: np.ndarray) -> np.ndarray:
+    squared_distances, t1, _ = _ray_circle_roots(origins, directions, centers, radii)
+    t = np.where(t1 >= 0, t1, np.inf) # nan >= 0 is False
+    return np.where(squared_distances <= radii[None]**2, 0., t)
+
+
+def ray_ring_distance(origins: np.ndarray, directions: np.ndarray, centers: np.ndarray, inner_radii: np.ndarray, outer_radii: np.ndarray) -> np.ndarray:
+    squared_distances, t1, _ = _ray_circle_roots(origins, directions, centers, outer_radii)
+    _, _, t2 = _ray_circle_roots(origins, directions, centers, inner_radii)
+    in_hole = squared_distances < inner_radii[None]**2
+    outside = squared_distances > outer_radii[None]**2
+    from_outside = np.where(t1 >= 0, t1, np.inf)
+    return np.where(in_hole, t2, np.where(outside, from_outside, 0.)) # from the hole, the ray always hits the inner circle
+
+
+def ray_distances(origins: np.ndarray, directions: np.ndarray, groups: dict, max_range: float = np.inf) -> np.ndarray:
+    # Casts the rays against all shapes of the groups (as returned by shape_groups) and returns the distance to the first hit for each
+    # ray, or max_range if nothing is hit within max_range
+    result = np.full(len(origins), max_range, dtype=np.float64)
+    if 'polygon' in groups:
+        result = np.minimum(result, ray_polygon_distance(origins, directions, groups['polygon'][1]).min(axis=1))
+    if 'circle' in groups:
+        result = np.minimum(result, ray_circle_distance(origins, directions, *groups['circle'][1:]).min(axis=1))
+    if 'ring' in groups:
+        result = np.minimum(result, ray_ring_distance(origins, directions, *groups['ring'][1:]).min(axis=1))
+    return result
@@ -0,0 +1,114 @@
+import os
+import struct
+import numpy as np
+
+# The columns of a trajectory log. Every row is the state of one movable agent after one tick: the simulation time, the index of the
+# agent in World.dynamic_agents, its pose and speed, and its controls during the tick.
+log_columns = ['t', 'agent', 'x', 'y', 'heading', 'speed', 'inputSteering', 'inputAcceleration']
+log_dtypes = {'agent': np.int32}
+
+
+def _npy_header(dtype: np.dtype, rows: int) -> bytes:
+    # The header of a 1-dimensional .npy file, always padded to 128 bytes so that it can be rewritten in place as the file grows
+    header = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (np.lib.format.dtype_to_descr(dtype), rows)
+    return b'\x93NUMPY\x01\x00' + struct.pack('<H', 118) + (header.ljust(117) + '\n').encode('latin1')
+
+
+class TrajectoryLogger:
+    # Logs the state of every movable agent after every tick into columns (see log_columns), e.g. to replay or analyze a run. Set
+    # world.logger to a TrajectoryLogger, and World.tick() appends one row per agent. The rows are copied into preallocated NumPy arrays
+    # of chunk_size rows (straight from the AgentBatch arrays if the world is batched), so logging costs a few array copies per tick,
+    # not a Python object per agent.
+    # Where the full chunks go depends on path:
+    #   - None: they stay in memory, columns() returns the whole log.
+    #   - a path ending with .npz: they stay in memory, and close() saves all columns into that file.
+    #   - any other path: a directory where every column is a .npy file. The full chunks are appended to the files, so the memory use is
+    #     bounded however long the run is, and the files are valid after every flush, e.g. for np.load(..., mmap_mode = 'r').
+    def __init__(self, path: str = None, chunk_size: int = 65536):
+        self.path = path
+        self.streaming = path is not None and not path.lower().endswith('.npz')
+        self.chunk_size = chunk_size
+        self.rows = 0 # the number of rows logged so far
+        self._chunk = {name: np.empty(chunk_size, dtype=log_dtypes.get(name, np.float64)) for name in log_columns}
+        self._filled = 0 # the number of rows in the current chunk
+        self._chunks = [] # the full chunks kept in memory
+        self._files = None
+        self._flushed = 0 # the number of rows in the files
+
+    def log(self, world: 'World'):
+        n = len(world.dynamic_agents)
+        if n == 0: return
+        if world.batch is not None:
+            b = world.batch # its rows are in the same order as world.dynamic_agents
+            values = {'x': b.center[:n,0], 'y': b.center[:n,1], 'heading': b.heading[:n],
+                      'speed': np.sqrt(b.velocity[:n,0]**2 + b.velocity[:n,1]**2),
+                      'inputSteering': b.inputSteering[:n], 'inputAcceleration': b.inputAcceleration[:n]}
+        else:
+            state = np.array([(agent.center.x, agent.center.y, agent.heading, agent.speed, agent.inputSteering, agent.inputAcceleration)
+                              for agent in world.dynamic_agents], dtype=np.float64)
+            values = dict(zip(log_columns[2:], state.T))
+        values['t'] = world.t
+        values['agent'] = np.arange(n)
+        start = 0
+        while start < n: # the rows may not fit into the current chunk
+            count = min(n - start, self.chunk_size - self._filled)
+            for name in log_columns:
+                value = values[name]
+                self._chunk[name][self._filled:self._filled + count] = value if np.ndim(value) == 0 else value[start:start + count]
+            self._filled += count
+            start += count
+            if self._filled == self.chunk_size:
+                self._store_chunk()
+        self.rows += n
+
+    def _store_chunk(self):
+        if self._filled == 0: return
+        if self.streaming:
+            self._write({name: column[:self._filled] for name, column in self._chunk.items()})
+        else:
+            self._chunks.append({name: column[:self._filled].copy() for name, column in self._chunk.items()})
+        self._filled = 0
+
+    def _write(self, chunk: dict):
+        if self._files is None:
+            os.makedirs(self.path, exist_ok = True)
+            self._files = {name: open(os.path.join(self.path, name + '.npy'), 'wb+') for name in log_columns}
+            for name, f in self._files.items():
+                f.write(_npy_header(self._chunk[name].dtype, 0))
+        rows = self._flushed + len(chunk['t'])
+        for name, f in self._files.items():
+            f.write(chunk[name].tobytes())
+            f.seek(0)
+            f.write(_npy_header(self._chunk[name].dtype, rows))
+            f.seek(0, os.SEEK_END)
+            f.flush()
+        self._flushed = rows
+
+    def flush(self):
+        # Writes the rows logged so far to the files (if streaming)
+        if self.streaming: self._store_chunk()
+
+    def columns(self) -> dict:
+        # The whole log as a dict of column name -> 1-dimensional array. When streaming, the columns are memory mapped from the files.
+        if self.streaming:
+            self.flush()
+            if self._flushed == 0: return {name: self._chunk[name][:0].copy() for name in log_columns}
+            return {name: np.load(os.path.join(self.path, name + '.npy'), mmap_mode = 'r') for name in log_columns}
+        chunks = self._chunks + [{name: column[:self._filled] for name, column in self._chunk.items()}]
+        return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in log_columns}
+
+    def close(self):
+        # Saves the .npz file or finishes the .npy files. The logger should not be used afterwards.
+        if self.streaming:
+            self.flush()
+            if self._files is not None:
+                for f in self._files.values(): f.close()
+                self._files = None
+        elif self.path is not None:
+            np.savez(self.path, **self.columns())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
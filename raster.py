@@ -0,0 +1,89 @@
+import numpy as np
+from entities import Entity, RectangleEntity, CircleEntity, RingEntity
+from kernels import points_in_polygons
+
+# Rasterization of entities onto NumPy arrays, without any dependency on Tk. Images have the same orientation as the visualizer: row 0
+# is the top of the world (y = height) and column 0 is its left side (x = 0). Each pixel is resolution x resolution meters, and it is
+# filled if its center is inside the shape. Images can have extra trailing dimensions (e.g. H x W x 3 for colors), the value is broadcast.
+
+
+def _pixel_window(box: tuple, image_shape: tuple, resolution: float, height: float) -> tuple:
+    # Returns the rows and columns (r0, r1, c0, c1) of the pixels whose centers can be in the box (xmin, ymin, xmax, ymax)
+    H, W = image_shape[:2]
+    c0 = max(int(np.floor(box[0] / resolution - 0.5)), 0)
+    c1 = min(int(np.ceil(box[2] / resolution - 0.5)) + 1, W)
+    r0 = max(int(np.floor((height - box[3]) / resolution - 0.5)), 0)
+    r1 = min(int(np.ceil((height - box[1]) / resolution - 0.5)) + 1, H)
+    return r0, r1, c0, c1
+
+
+def _pixel_centers(window: tuple, resolution: float, height: float) -> tuple:
+    r0, r1, c0, c1 = window
+    x = (np.arange(c0, c1) + 0.5) * resolution
+    y = height - (np.arange(r0, r1) + 0.5) * resolution
+    return x[None,:], y[:,None]
+
+
+def fill_polygon(image: np.ndarray, polygon: np.ndarray, value, resolution: float, height: float):
+    # polygon is a K x 2 array of the corners of a convex polygon in world coordinates
+    window = _pixel_window((polygon[:,0].min(), polygon[:,1].min(), polygon[:,0].max(), polygon[:,1].max()), image.shape, resolution, height)
+    r0, r1, c0, c1 = window
+    if r0 >= r1 or c0 >= c1: return
+    x, y = _pixel_centers(window, resolution, height)
+    points = np.stack(np.broadcast_arrays(x, y), axis=-1)
+    image[r0:r1, c0:c1][points_in_polygons(points, polygon)] = value
+
+
+def fill_circle(image: np.ndarray, center: tuple, radius: float, value, resolution: float, height: float, inner_radius: float = 0.):
+    # Fills the pixels between inner_radius and radius away from the center, so this also draws rings
+    cx, cy = center
+    window = _pixel_window((cx - radius, cy - radius, cx + radius, cy + radius), image.shape, resolution, height)
+    r0, r1, c0, c1 = window
+    if r0 >= r1 or c0 >= c1: return
+    x, y = _pixel_centers(window, resolution, height)
+    squared_distances = (x - cx)**2 + (y - cy)**2
+    mask = squared_distances <= radius**2
+    if inner_radius > 0: mask &= squared_distances >= inner_radius**2
+    image[r0:r1, c0:c1][mask] = value
+
+
+def fill_entity(image: np.ndarray, entity: Entity, value, resolution: float, height: float):
+    if isinstance(entity, RectangleEntity):
+        fill_polygon(image, entity.corners_array, value, resolution, height)
+    elif isinstance(entity, CircleEntity):
+        fill_circle(image, (entity.center.x, entity.center.y), entity.radius, value, resolution, height)
+    elif isinstance(entity, RingEntity):
+        fill_circle(image, (entity.center.x, entity.center.y), entity.outer_radius, value, resolution, height, entity.inner_radius)
+    else:
+        raise NotImplementedError
+
+
+class OccupancyRasterizer:
+    # Turns the agents of a world into a multi-channel bird's-eye-view occupancy grid of shape len(channels) x H x W, where each cell is
+    # resolution x resolution meters. The static channels are rasterized once and cached until the set of static agents changes, so only
+    # the movable agents are drawn at each call.
+    channels = ['obstacles', 'paintings', 'agents'] # collidable static agents, non-collidable static agents, movable agents
+
+    def __init__(self, world: 'World', resolution: float = 0.5):
+        self.world = world
+        self.resolution = resolution
+        self.shape = (int(np.ceil(world.height / resolution)), int(np.ceil(world.width / resolution)))
+        self._static_layers = None
+        self._static_version = None
+
+    @property
+    def static_layers(self) -> np.ndarray:
+        if self._static_layers is None or self._static_version != self.world.static_version:
+            layers = np.zeros((2,) + self.shape, dtype=bool)
+            for agent in self.world.static_agents:
+                fill_entity(layers[0 if agent.collidable else 1], agent, True, self.resolution, self.world.height)
+            self._static_layers = layers
+            self._static_version = self.world.static_version
+        return self._static_layers
+
+    def rasterize(self, dtype: np.dtype = np.float32) -> np.ndarray:
+        grid = np.zeros((len(self.channels),) + self.shape, dtype=dtype)
+        grid[:2] = self.static_layers
+        for agent in self.world.dynamic_agents:
+            fill_entity(grid[2], agent, 1, self.resolution, self.world.height)
+        return grid
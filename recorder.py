@@ -0,0 +1,113 @@
+import os
+import queue
+import struct
+import threading
+import zlib
+import numpy as np
+from renderer import OffscreenRenderer
+
+
+def png_bytes(frame: np.ndarray, compression: int = 1) -> bytes:
+    # Encodes an H x W x 3 uint8 RGB frame as a PNG file (8-bit truecolor, no filtering), with the zlib compression level
+    H, W = frame.shape[:2]
+    raw = np.zeros((H, 1 + 3*W), dtype=np.uint8) # every row starts with its filter type, 0
+    raw[:,1:] = frame.reshape(H, 3*W)
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', W, H, 8, 2, 0, 0, 0)) +
+            chunk(b'IDAT', zlib.compress(raw.tobytes(), compression)) + chunk(b'IEND', b''))
+
+
+def rgb_to_yuv444(frame: np.ndarray) -> np.ndarray:
+    # Converts an H x W x 3 uint8 RGB frame into the 3 x H x W planes of (studio range) BT.601 Y'CbCr, as in a C444 Y4M stream
+    rgb = frame.astype(np.float32)
+    y = 16. + 0.257*rgb[...,0] + 0.504*rgb[...,1] + 0.098*rgb[...,2]
+    cb = 128. - 0.148*rgb[...,0] - 0.291*rgb[...,1] + 0.439*rgb[...,2]
+    cr = 128. + 0.439*rgb[...,0] - 0.368*rgb[...,1] - 0.071*rgb[...,2]
+    return np.rint(np.stack([y, cb, cr])).astype(np.uint8)
+
+
+class FrameRecorder:
+    # Streams the frames of a world to disk while it runs: either as a sequence of PNG files in a directory, or as one uncompressed Y4M
+    # video (if path ends with .y4m), which e.g. ffmpeg can read and convert. The frames are rendered with an OffscreenRenderer, so this
+    # also works for headless worlds. Set world.recorder to a FrameRecorder, and every World.render() call captures a frame.
+    # The encoding and the writing happen in a background thread. The frames wait for it in a queue of at most max_queue frames, so the
+    # memory use is bounded however long the recording is. If the writer falls behind and the queue is full, a frame is dropped (and
+    # counted in dropped_frames) instead of stalling the simulation, unless block is True.
+    # fps is the frame rate of the recording in simulated time: a frame is only captured if 1/fps simulated seconds passed since the last
+    # one. By default, every render() is captured and the frame rate is 1/dt.
+    def __init__(self, path: str, fps: float = None, ppm: float = None, max_queue: int = 64, block: bool = False, compression: int = 1):
+        self.path = path
+        self.format = 'y4m' if path.lower().endswith('.y4m') else 'png'
+        self.fps = fps
+        self.ppm = ppm
+        self.block = block
+        self.compression = compression
+        self.frames_written = 0
+        self.dropped_frames = 0
+        self._renderer = None
+        self._next_time = None
+        self._file = None
+        self._error = None
+        self._queue = queue.Queue(maxsize = max_queue)
+        self._thread = threading.Thread(target = self._write_frames, daemon = True)
+        self._thread.start()
+
+    def capture(self, world: 'World'):
+        # Renders the current frame of the world and queues it for writing
+        self._check()
+        if self._renderer is None or self._renderer.world is not world:
+            self._renderer = OffscreenRenderer(world, ppm = self.ppm)
+            if self.fps is None: self.fps = 1. / world.dt
+        if self._next_time is not None and world.t < self._next_time - 1e-9: return
+        self._next_time = world.t + 1. / self.fps
+        self.write(self._renderer.render())
+
+    def write(self, frame: np.ndarray):
+        # Queues an H x W x 3 uint8 RGB frame for writing. The frame must not be modified afterwards.
+        self._check()
+        try:
+            self._queue.put(frame, block = self.block)
+        except queue.Full:
+            self.dropped_frames += 1
+
+    def close(self):
+        # Waits until all queued frames are written, and closes the file
+        if not self._thread.is_alive(): return
+        self._queue.put(None)
+        self._thread.join()
+        self._check()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _check(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError('The frame recorder could not write ' + self.path) from error
+
+    def _write_frames(self):
+        try:
+            while True:
+                frame = self._queue.get()
+                if frame is None: break
+                if self.format == 'png':
+                    if self.frames_written == 0: os.makedirs(self.path, exist_ok = True)
+                    with open(os.path.join(self.path, 'frame_%06d.png' % self.frames_written), 'wb') as f:
+                        f.write(png_bytes(frame, self.compression))
+                else:
+                    if self._file is None:
+                        rate = np.round(self.fps * 1000).astype(int)
+                        self._file = open(self.path, 'wb')
+                        self._file.write(b'YUV4MPEG2 W%d H%d F%d:1000 Ip A1:1 C444\n' % (frame.shape[1], frame.shape[0], rate))
+                    self._file.write(b'FRAME\n')
+                    self._file.write(rgb_to_yuv444(frame).tobytes())
+                self.frames_written += 1
+        except Exception as error:
+            self._error = error
+            while self._queue.get() is not None: pass # keep draining, so that write() and close() do not block
+        finally:
+            if self._file is not None: self._file.close()
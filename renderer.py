@@ -0,0 +1,63 @@
+import numpy as np
+from raster import fill_entity
+
+# The Tk color names used by CARLO (and a few more common ones) with their RGB values, so that frames can be rendered without Tk. Like
+# in Tk, the names are case insensitive and spaces are ignored, and gray0, ..., gray100 (or grey) are understood as well. Colors can
+# also be given as '#rgb' or '#rrggbb'.
+TK_COLORS = {
+    'white': (255, 255, 255), 'black': (0, 0, 0), 'red': (255, 0, 0), 'green': (0, 255, 0), 'blue': (0, 0, 255),
+    'yellow': (255, 255, 0), 'cyan': (0, 255, 255), 'magenta': (255, 0, 255), 'orange': (255, 165, 0), 'purple': (160, 32, 240),
+    'brown': (165, 42, 42), 'pink': (255, 192, 203), 'gold': (255, 215, 0), 'salmon': (250, 128, 114), 'gray': (190, 190, 190),
+    'lightgray': (211, 211, 211), 'darkgray': (169, 169, 169), 'darkgreen': (0, 100, 0), 'ghostwhite': (248, 248, 255),
+    'lightsalmon': (255, 160, 122), 'lightsalmon1': (255, 160, 122), 'lightsalmon2': (238, 149, 114), 'lightsalmon3': (205, 129, 98),
+    'lightsalmon4': (139, 87, 66),
+}
+TK_COLORS.update({'gray' + str(k): (round(2.55*k),) * 3 for k in range(101)})
+
+
+def color_to_rgb(color: str) -> tuple:
+    name = color.lower().replace(' ', '').replace('grey', 'gray')
+    if name.startswith('#'):
+        digits = (len(name) - 1) // 3
+        return tuple(int(name[1 + k*digits:1 + (k+1)*digits], 16) * 255 // (16**digits - 1) for k in range(3))
+    if name not in TK_COLORS:
+        raise ValueError('Unknown color ' + repr(color) + ', add it to renderer.TK_COLORS or use the #rrggbb format')
+    return TK_COLORS[name]
+
+
+def draw_agents(image: np.ndarray, agents: list, ppm: float, height: float):
+    # Draws the agents (in order, so the later ones are on top) onto an H x W x 3 uint8 image with ppm pixels per meter, where the bottom
+    # row of pixels is at y = height - H / ppm
+    for agent in agents:
+        fill_entity(image, agent, color_to_rgb(agent.color), 1. / ppm, height)
+
+
+class OffscreenRenderer:
+    # Renders the world into H x W x 3 uint8 RGB arrays without a display, with the same size (ppm pixels per meter), orientation and
+    # colors as the Visualizer. The static agents are drawn once onto a cached background, which is only redrawn when the set of static
+    # agents changes, so a frame costs one copy of the background plus the movable agents.
+    def __init__(self, world: 'World', ppm: float = None, bg_color: str = 'gray'):
+        self.world = world
+        self.ppm = world.ppm if ppm is None else ppm
+        self.bg_color = bg_color
+        self.shape = (int(world.height*self.ppm), int(world.width*self.ppm), 3)
+        self.height = self.shape[0] / self.ppm # the visualizer puts y = 0 at the bottom row of pixels
+        self._background = None
+        self._static_version = None
+
+    @property
+    def background(self) -> np.ndarray:
+        if self._background is None or self._static_version != self.world.static_version:
+            background = np.empty(self.shape, dtype=np.uint8)
+            background[:] = color_to_rgb(self.bg_color)
+            draw_agents(background, self.world.static_agents, self.ppm, self.height)
+            self._background = background
+            self._static_version = self.world.static_version
+        return self._background
+
+    def render(self, out: np.ndarray = None) -> np.ndarray:
+        # Returns the current frame. If out (an H x W x 3 uint8 array, e.g. in shared memory) is given, the frame is written into it.
+        frame = self.background.copy() if out is None else out
+        if out is not None: np.copyto(frame, self.background)
+        draw_agents(frame, self.world.dynamic_agents, self.ppm, self.height)
+        return frame
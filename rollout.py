@@ -0,0 +1,62 @@
+import numpy as np
+from entities import Entity, RectangleEntity, CircleEntity, RingEntity
+from dynamics import bicycle_step
+from broadphase import bounding_box
+from kernels import rectangle_corners, shape_groups, shape_distances
+
+# The columns of the states returned by rollout()
+rollout_columns = ['x', 'y', 'heading', 'speed']
+
+
+def _swept_shapes(entity: Entity, centers: np.ndarray, headings: np.ndarray) -> tuple:
+    # Returns the shape kind, the shapes (like in shape_groups) and the bounding boxes (N x 4) of the entity at the N given poses
+    if isinstance(entity, RectangleEntity):
+        half_size = np.array([entity.size.x, entity.size.y]) / 2.
+        corners = rectangle_corners(centers, half_size, headings)
+        return 'polygon', (corners,), np.concatenate([corners.min(axis=1), corners.max(axis=1)], axis=1)
+    if isinstance(entity, CircleEntity):
+        radii = np.full(len(centers), float(entity.radius))
+        return 'circle', (centers, radii), np.concatenate([centers - radii[:,None], centers + radii[:,None]], axis=1)
+    if isinstance(entity, RingEntity):
+        inner_radii = np.full(len(centers), float(entity.inner_radius))
+        outer_radii = np.full(len(centers), float(entity.outer_radius))
+        return 'ring', (centers, inner_radii, outer_radii), np.concatenate([centers - outer_radii[:,None], centers + outer_radii[:,None]], axis=1)
+    raise NotImplementedError
+
+
+def rollout(entity: Entity, controls: np.ndarray, dt: float, static_index: 'StaticBVH' = None) -> tuple:
+    # Simulates K candidate control sequences for the entity in parallel, starting from its current state, without modifying it.
+    # controls is a K x H x 2 array of (steering, acceleration), applied for dt seconds each with the kinematic bicycle model of
+    # Entity.tick. Returns the states (K x H x 4, see rollout_columns) after each of the H steps and the K x H collision flags of these
+    # states against the entities of static_index (usually World.static_index), or all False if it is not given.
+    assert entity.movable, 'Only movable entities can be rolled out'
+    controls = np.asarray(controls, dtype=np.float64)
+    K, H = controls.shape[:2]
+    states = np.zeros((K, H, 4), dtype=np.float64)
+    center = np.tile(entity.pose_cache.center, (K, 1))
+    heading = np.full(K, float(entity.heading))
+    speed = np.full(K, float(entity.speed))
+    for h in range(H):
+        center, heading, velocity, _, _ = bicycle_step(center, heading, speed, controls[:,h,0], controls[:,h,1], entity.friction,
+                                                       entity.rear_dist, entity.min_speed, entity.max_speed, dt)
+        speed = np.sqrt(velocity[:,0]**2 + velocity[:,1]**2)
+        states[:,h,:2], states[:,h,2], states[:,h,3] = center, heading, speed
+
+    collisions = np.zeros((K, H), dtype=bool)
+    if static_index is None or K*H == 0: return states, collisions
+
+    # Broadphase: the candidates are the static entities in the box around all trajectories, and only the (state, candidate) pairs whose
+    # bounding boxes overlap are checked with the vectorized distance kernels.
+    kind, shapes, boxes = _swept_shapes(entity, states[...,:2].reshape(-1, 2), states[...,2].reshape(-1))
+    candidates = [other for other in static_index.query((*boxes[:,:2].min(axis=0), *boxes[:,2:].max(axis=0))) if other is not entity]
+    if not candidates: return states, collisions
+    candidate_boxes = np.array([bounding_box(other) for other in candidates], dtype=np.float64)
+    flags = collisions.reshape(-1)
+    for other_kind, (indices, *other_shapes) in shape_groups(candidates).items():
+        other_boxes = candidate_boxes[indices]
+        rows, columns = np.nonzero((boxes[:,None,0] <= other_boxes[None,:,2]) & (other_boxes[None,:,0] <= boxes[:,None,2]) &
+                                   (boxes[:,None,1] <= other_boxes[None,:,3]) & (other_boxes[None,:,1] <= boxes[:,None,3]))
+        if len(rows) == 0: continue
+        distances = shape_distances(kind, [x[rows] for x in shapes], other_kind, [x[columns] for x in other_shapes])
+        flags[rows[distances <= 0]] = True
+    return states, collisions
@@ -0,0 +1,69 @@
+import time
+from typing import Callable
+
+
+class RunStats:
+    # What World.run achieved: the number of ticks and rendered frames, the frames that were skipped to keep up with the wall clock, and
+    # the simulated and the wall clock time
+    def __init__(self):
+        self.ticks = 0
+        self.frames = 0
+        self.skipped_frames = 0
+        self.sim_time = 0.
+        self.wall_time = 0.
+
+    @property
+    def sim_rate(self) -> float: # ticks per wall clock second
+        return self.ticks / self.wall_time if self.wall_time > 0 else 0.
+
+    @property
+    def frame_rate(self) -> float: # rendered frames per wall clock second
+        return self.frames / self.wall_time if self.wall_time > 0 else 0.
+
+    @property
+    def real_time_factor(self) -> float: # simulated seconds per wall clock second
+        return self.sim_time / self.wall_time if self.wall_time > 0 else 0.
+
+    def __str__(self):
+        return 'RunStats(%d ticks at %.1f Hz, %d frames at %.1f fps, %d skipped, %.2fx real time)' % (
+            self.ticks, self.sim_rate, self.frames, self.frame_rate, self.skipped_frames, self.real_time_factor)
+
+
+def run(world: 'World', num_ticks: int = None, controller: Callable = None, real_time_factor: float = 1., fps: float = 30.,
+        max_frame_skip: int = 5) -> RunStats:
+    # Ticks the world at a fixed simulation rate, real_time_factor simulated seconds per wall clock second, and renders it at most fps
+    # times per wall clock second. A frame is only rendered if the simulation is on schedule: when it falls behind the wall clock, the
+    # frames are skipped (but never more than max_frame_skip in a row, so the window does not freeze) and the time goes to the ticks.
+    # With real_time_factor = None, the world is ticked as fast as possible. A headless world is never rendered.
+    # If the world has a recorder, it is offered every tick (also when headless or when the frame is skipped), and captures the frames at
+    # its own rate in simulated time, so that recordings do not depend on how fast the loop runs.
+    # controller(world) is called before every tick, e.g. to set the controls of the agents. The run stops when it returns False, or
+    # after num_ticks ticks (if given).
+    stats = RunStats()
+    render = not world.headless and fps is not None and fps > 0
+    start = time.perf_counter()
+    start_t = world.t
+    next_frame = start
+    skipped_in_a_row = 0
+    while num_ticks is None or stats.ticks < num_ticks:
+        if controller is not None and controller(world) is False: break
+        world.tick()
+        stats.ticks += 1
+        if world.recorder is not None: world.recorder.capture(world)
+        now = time.perf_counter()
+        due = None if real_time_factor is None else start + (world.t - start_t) / real_time_factor # when the next tick should start
+        if render and now >= next_frame:
+            if due is None or now <= due or skipped_in_a_row >= max_frame_skip:
+                world.render()
+                stats.frames += 1
+                skipped_in_a_row = 0
+                now = time.perf_counter()
+                next_frame = max(next_frame + 1. / fps, now) # keep the frame rate steady, but do not try to catch up with missed frames
+            else:
+                stats.skipped_frames += 1
+                skipped_in_a_row += 1
+        if due is not None and due > now:
+            time.sleep(due - now)
+    stats.wall_time = time.perf_counter() - start
+    stats.sim_time = world.t - start_t
+    return stats
@@ -0,0 +1,37 @@
+import numpy as np
+from entities import Entity
+from kernels import shape_groups, ray_distances
+
+
+class Lidar:
+    # A range sensor that casts num_beams rays from the center of an entity, spread evenly over the field of view fov around its heading.
+    # The rays are intersected with the collidable static agents (the candidates come from the world's static index) and with the other
+    # collidable movable agents, all in batched NumPy. A scan returns the range measured by each beam, which is max_range if the beam
+    # does not hit anything.
+    def __init__(self, num_beams: int = 64, max_range: float = 50., fov: float = 2*np.pi):
+        self.num_beams = num_beams
+        self.max_range = max_range
+        self.fov = fov
+        full_circle = np.isclose(fov, 2*np.pi)
+        self.angles = np.linspace(-fov/2., fov/2., num_beams, endpoint = not full_circle) # relative to the heading
+        self._cos, self._sin = np.cos(self.angles), np.sin(self.angles)
+
+    def candidates(self, world: 'World', entity: Entity) -> list:
+        # The agents that can be hit by a beam, i.e. whose bounding boxes overlap with the box around the sensor's range
+        (x, y), r = entity.pose_cache.center, self.max_range
+        box = (x - r, y - r, x + r, y + r)
+        others = world.static_index.query(box) + world.grid.query(box)
+        return [other for other in others if other is not entity and other.collidable]
+
+    def scan(self, world: 'World', entity: Entity) -> np.ndarray:
+        pose = entity.pose_cache # the beam directions are the relative ones rotated by the heading
+        directions = np.stack([pose.cos*self._cos - pose.sin*self._sin, pose.sin*self._cos + pose.cos*self._sin], axis=-1)
+        origins = np.broadcast_to(pose.center, directions.shape)
+        candidates = self.candidates(world, entity)
+        if not candidates:
+            return np.full(self.num_beams, self.max_range)
+        return ray_distances(origins, directions, shape_groups(candidates), self.max_range)
+
+    def scan_all(self, world: 'World', entities: list) -> np.ndarray:
+        # Returns the len(entities) x num_beams ranges of all given entities
+        return np.stack([self.scan(world, entity) for entity in entities]) if entities else np.zeros((0, self.num_beams))
@@ -0,0 +1,158 @@
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import time
+import numpy as np
+from typing import Callable
+
+
+# Layout of the arrays that VecWorld exchanges with its worlds. K is the number of worlds and A is the number of movable agents per world.
+def _buffer_specs(num_worlds: int, num_agents: int) -> dict:
+    return {'controls': ((num_worlds, num_agents, 2), np.float64), # steering, acceleration
+            'observations': ((num_worlds, num_agents, 4), np.float64), # x, y, heading, speed
+            'rewards': ((num_worlds,), np.float64),
+            'collisions': ((num_worlds,), bool)}
+
+
+def _observe(world: 'World', observations: np.ndarray):
+    # Writes the states of the world's movable agents into observations (A x 4)
+    batch = world.batch
+    if batch is not None:
+        n = len(batch)
+        observations[:,:2] = batch.center[:n]
+        observations[:,2] = batch.heading[:n]
+        observations[:,3] = np.sqrt(batch.velocity[:n,0]**2 + batch.velocity[:n,1]**2)
+    else:
+        observations[:] = [(agent.x, agent.y, agent.heading, agent.speed) for agent in world.dynamic_agents]
+
+
+def _step(world: 'World', k: int, buffers: dict, reward_fn: Callable):
+    for agent, control in zip(world.dynamic_agents, buffers['controls'][k]):
+        agent.set_control(control[0], control[1])
+    world.tick()
+    _observe(world, buffers['observations'][k])
+    buffers['rewards'][k] = 0. if reward_fn is None else reward_fn(world)
+    buffers['collisions'][k] = world.collision_exists()
+
+
+def _worker(make_world: Callable, start: int, end: int, names: dict, num_worlds: int, num_agents: int, reward_fn: Callable, connection):
+    # Runs in a separate process and owns the worlds start, ..., end-1. It steps them on request, and the data goes through shared memory.
+    memories = {name: shared_memory.SharedMemory(name=names[name]) for name in names}
+    buffers = {name: np.ndarray(shape, dtype=dtype, buffer=memories[name].buf) for name, (shape, dtype) in _buffer_specs(num_worlds, num_agents).items()}
+    worlds = {}
+    try:
+        while True:
+            command, indices = connection.recv()
+            if command == 'step':
+                for k, world in worlds.items():
+                    _step(world, k, buffers, reward_fn)
+            elif command == 'reset':
+                for k in indices:
+                    if start <= k < end:
+                        if k in worlds: worlds[k].close()
+                        worlds[k] = make_world()
+                        _observe(worlds[k], buffers['observations'][k])
+            connection.send(True)
+            if command == 'close': break
+    finally:
+        for world in worlds.values():
+            world.close()
+        del buffers
+        for memory in memories.values():
+            memory.close()
+
+
+class VecWorld:
+    # Holds num_worlds independent worlds created by make_world() (which has to return a World) and steps them together. Each world must
+    # have the same number A of movable agents. step() takes the controls of all agents as a K x A x 2 array of (steering, acceleration)
+    # and returns the stacked observations (K x A x 4 array of x, y, heading, speed), rewards (K, computed by reward_fn(world) if given)
+    # and collision flags (K).
+    # With num_processes = 0, the worlds are stepped in this process. Otherwise, they are split among num_processes worker processes and
+    # the arrays are exchanged through shared memory. In that case, make_world and reward_fn need to be picklable (e.g. module-level
+    # functions). The returned arrays are reused by the next step, so copy them if you need to keep them.
+    def __init__(self, make_world: Callable, num_worlds: int, num_processes: int = 0, reward_fn: Callable = None):
+        self.make_world = make_world
+        self.num_worlds = num_worlds
+        self.num_processes = min(num_processes, num_worlds)
+        self.reward_fn = reward_fn
+        self.num_steps = 0
+        self.step_time = 0.
+
+        first = make_world()
+        self.num_agents = len(first.dynamic_agents)
+        first.close()
+        specs = _buffer_specs(num_worlds, self.num_agents)
+
+        if self.num_processes == 0:
+            self.buffers = {name: np.zeros(shape, dtype=dtype) for name, (shape, dtype) in specs.items()}
+            self.worlds = []
+        else:
+            self._memories = {name: shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1))
+                              for name, (shape, dtype) in specs.items()}
+            self.buffers = {name: np.ndarray(shape, dtype=dtype, buffer=self._memories[name].buf) for name, (shape, dtype) in specs.items()}
+            for buffer in self.buffers.values(): buffer[:] = 0
+            names = {name: memory.name for name, memory in self._memories.items()}
+            bounds = np.linspace(0, num_worlds, self.num_processes + 1).astype(int)
+            self._connections = []
+            self._processes = []
+            for start, end in zip(bounds[:-1], bounds[1:]):
+                parent, child = mp.Pipe()
+                process = mp.Process(target=_worker, args=(make_world, start, end, names, num_worlds, self.num_agents, reward_fn, child), daemon=True)
+                process.start()
+                self._connections.append(parent)
+                self._processes.append(process)
+        self.reset()
+
+    def _broadcast(self, command: str, indices: list = None):
+        for connection in self._connections:
+            connection.send((command, indices))
+        for connection in self._connections:
+            connection.recv()
+
+    def reset(self, indices: list = None) -> np.ndarray:
+        # (Re)creates the given worlds (all of them by default) with make_world and returns the observations
+        if indices is None: indices = range(self.num_worlds)
+        indices = [int(k) for k in indices]
+        if self.num_processes == 0:
+            if not self.worlds: self.worlds = [None] * self.num_worlds
+            for k in indices:
+                if self.worlds[k] is not None: self.worlds[k].close()
+                self.worlds[k] = self.make_world()
+                _observe(self.worlds[k], self.buffers['observations'][k])
+        else:
+            self._broadcast('reset', indices)
+        self.buffers['rewards'][indices] = 0.
+        self.buffers['collisions'][indices] = False
+        return self.buffers['observations']
+
+    def step(self, controls: np.ndarray) -> tuple:
+        start = time.perf_counter()
+        self.buffers['controls'][:] = controls
+        if self.num_processes == 0:
+            for k, world in enumerate(self.worlds):
+                _step(world, k, self.buffers, self.reward_fn)
+        else:
+            self._broadcast('step')
+        self.step_time += time.perf_counter() - start
+        self.num_steps += 1
+        return self.buffers['observations'], self.buffers['rewards'], self.buffers['collisions']
+
+    @property
+    def steps_per_second(self) -> float:
+        # The number of world ticks per second of step() calls, summed over all worlds
+        return self.num_worlds * self.num_steps / self.step_time if self.step_time > 0 else 0.
+
+    def close(self):
+        if self.num_processes == 0:
+            for world in self.worlds:
+                world.close()
+            self.worlds = []
+            return
+        if not self._processes: return
+        self._broadcast('close')
+        for process in self._processes:
+            process.join()
+        self._processes = []
+        self.buffers = {}
+        for memory in self._memories.values():
+            memory.close()
+            memory.unlink()
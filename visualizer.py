@@ -1,54 +1,128 @@
 from graphics import *
 from entities import RectangleEntity, CircleEntity, RingEntity
+from geometry import PointArray
+from renderer import color_to_rgb, draw_agents
+import numpy as np
 
 class Visualizer:
     def __init__(self, width: float, height: float, ppm: int):
         # width (meters)
         # height (meters)
         # ppm is the number of pixels per meters
-        
+
         self.ppm = ppm
         self.display_width, self.display_height = int(width*ppm), int(height*ppm)
         self.window_created = False
-        self.visualized_imgs = []
-        
-        
+        self.visualized_imgs = {} # id(agent) -> (agent, its canvas item)
+        self._reset_background()
+
+    def _reset_background(self):
+        # The static agents are drawn into one image (see update_background), which is the lowest canvas item
+        self._background_key = None # the static agents the background was drawn for
+        self._background_id = None
+        self._background_photo = None # Tk does not keep a reference to the image, so we have to
+        self._live_statics = [] # the static agents that could not be drawn into the background, they get their own canvas items
+
     def create_window(self, bg_color: str = 'gray80'):
         if not self.window_created or self.win.isClosed():
-            self.win = GraphWin('CARLO', self.display_width, self.display_height)
+            # Without autoflush, drawing only changes the canvas, and update_agents shows the whole frame at once with a single update
+            self.win = GraphWin('CARLO', self.display_width, self.display_height, autoflush = False)
             self.win.setBackground(bg_color)
             self.window_created = True
-            self.visualized_imgs = []
-            
+            self.bg_color = bg_color
+            self.visualized_imgs = {}
+            self._reset_background()
+            update()
+
+    def screen_coords(self, agent) -> list:
+        # The flat list of canvas coordinates of the agent's item: the corners of a polygon, or the bounding box of a circle or ring
+        if isinstance(agent, RectangleEntity):
+            C = self.ppm*PointArray(agent.corners_array)
+            C.xy[:,1] = self.display_height - C.xy[:,1]
+            return C.xy.ravel().tolist()
+        x, y = self.ppm*agent.center.x, self.display_height - self.ppm*agent.center.y
+        if isinstance(agent, CircleEntity):
+            r = self.ppm*agent.radius
+        elif isinstance(agent, RingEntity):
+            r = self.ppm*(agent.inner_radius + agent.outer_radius) / 2. # the ring is drawn as a thick outline along the middle circle
+        else:
+            raise NotImplementedError
+        return [x - r, y - r, x + r, y + r]
+
+    def create_img(self, agent) -> GraphicsObject:
+        if isinstance(agent, RectangleEntity):
+            C = self.screen_coords(agent)
+            img = Polygon([Point(x, y) for x, y in zip(C[0::2], C[1::2])])
+        elif isinstance(agent, CircleEntity):
+            img = Circle(Point(self.ppm*agent.center.x, self.display_height - self.ppm*agent.center.y), self.ppm*agent.radius)
+        elif isinstance(agent, RingEntity):
+            img = CircleRing(Point(self.ppm*agent.center.x, self.display_height - self.ppm*agent.center.y), self.ppm*agent.inner_radius, self.ppm*agent.outer_radius)
+        else:
+            raise NotImplementedError
+        img.setFill(agent.color)
+        return img
+
+    def update_background(self, static_agents: list):
+        # Rasterizes the static agents (with the offscreen renderer's drawing code) into a single image that is shown behind everything
+        # else, so that e.g. hundreds of lane markers do not become hundreds of canvas items. It is only redrawn if the static agents
+        # change. The agents whose colors the renderer does not know are left out and are drawn as separate canvas items instead.
+        key = [(id(agent), agent.color) for agent in static_agents]
+        if key == self._background_key: return
+        self._background_key = key
+        try:
+            background_color = color_to_rgb(self.bg_color)
+        except ValueError: # then the window background shows and every static agent gets its own item
+            self._live_statics = list(static_agents)
+            return
+        flattened, self._live_statics = [], []
+        for agent in static_agents:
+            try:
+                color_to_rgb(agent.color)
+                flattened.append(agent)
+            except ValueError:
+                self._live_statics.append(agent)
+        image = np.empty((self.display_height, self.display_width, 3), dtype=np.uint8)
+        image[:] = background_color
+        draw_agents(image, flattened, self.ppm, self.display_height / self.ppm)
+        photo = tk.PhotoImage(master = self.win, data = b'P6 %d %d 255 ' % (self.display_width, self.display_height) + image.tobytes(), format = 'PPM')
+        if self._background_id is None:
+            self._background_id = self.win.create_image(0, 0, image = photo, anchor = 'nw')
+            self.win.tag_lower(self._background_id)
+        else:
+            self.win.itemconfig(self._background_id, image = photo)
+        self._background_photo = photo
+
     def update_agents(self, agents: list):
-        new_visualized_imgs = []
-        
-        # Remove the movable agents from the window
-        for imgItem in self.visualized_imgs:
-            if imgItem['movable']:
-                imgItem['graphics'].undraw()
-            else:
-                new_visualized_imgs.append({'movable': False, 'graphics': imgItem['graphics']})
-                
-        # Add the updated movable agents (and the unmovable ones if they were not rendered before)
+        # The static agents go into the background image. Every other agent gets one canvas item when it is first seen. After that,
+        # the items of the movable agents are only moved to their new coordinates, and the items of the agents that are gone are deleted.
+        # The window is updated once at the end.
+        self.update_background([agent for agent in agents if not agent.movable])
+        agents = self._live_statics + [agent for agent in agents if agent.movable]
+        visualized_imgs = {}
+        lowest_movable = min((img.id for agent, img in self.visualized_imgs.values() if agent.movable), default=None)
         for agent in agents:
-            if agent.movable or not self.visualized_imgs:
-                if isinstance(agent, RectangleEntity):
-                    C = [self.ppm*c for c in agent.corners]
-                    img = Polygon([Point(c.x, self.display_height-c.y) for c in C])
-                elif isinstance(agent, CircleEntity):
-                    img = Circle(Point(self.ppm*agent.center.x, self.display_height - self.ppm*agent.center.y), self.ppm*agent.radius)
-                elif isinstance(agent, RingEntity):
-                    img = CircleRing(Point(self.ppm*agent.center.x, self.display_height - self.ppm*agent.center.y), self.ppm*agent.inner_radius, self.ppm*agent.outer_radius)
-                else:
-                    raise NotImplementedError
-                img.setFill(agent.color)
+            entry = self.visualized_imgs.get(id(agent))
+            if entry is None or entry[0] is not agent:
+                img = self.create_img(agent)
                 img.draw(self.win)
-                new_visualized_imgs.append({'movable': agent.movable, 'graphics': img})
-                
-        self.visualized_imgs = new_visualized_imgs
+                if not agent.movable and lowest_movable is not None: # keep the static agents below the movable ones
+                    self.win.tag_lower(img.id, lowest_movable)
+            else:
+                img = entry[1]
+                if agent.movable:
+                    self.win.coords(img.id, *self.screen_coords(agent))
+                    if img.config['outline' if isinstance(img, CircleRing) else 'fill'] != agent.color:
+                        img.setFill(agent.color)
+            visualized_imgs[id(agent)] = (agent, img)
+
+        for key, (agent, img) in self.visualized_imgs.items():
+            if key not in visualized_imgs or visualized_imgs[key][0] is not agent:
+                img.undraw()
+        self.visualized_imgs = visualized_imgs
+        update()
 
     def close(self):
         self.window_created = False
         self.win.close()
-        self.visualized_imgs = []
\ No newline at end of file
+        self.visualized_imgs = {}
+        self._reset_background()
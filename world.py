@@ -1,28 +1,160 @@
 from agents import Car, Pedestrian, RectangleBuilding
-from entities import Entity
+from entities import Entity, RectangleEntity
+from dynamics import AgentBatch, substep_counts
+from broadphase import UniformGrid, bounding_box
+from bvh import StaticBVH
+from kernels import rectangle_arrays, rectangles_overlap, distance_matrix
+from rollout import rollout
+from ccd import swept_boxes, swept_distances
+from scheduler import run, RunStats
+import numpy as np
+from geometry import Point
 from typing import Union
-from visualizer import Visualizer
 
 class World:
-    def __init__(self, dt: float, width: float, height: float, ppm: float = 8):
+    def __init__(self, dt: float, width: float, height: float, ppm: float = 8, batched: bool = False, headless: bool = False, cell_size: float = 10.,
+                 continuous: bool = False, tolerance: float = None, max_substeps: int = 64):
         self.dynamic_agents = []
         self.static_agents = []
         self.t = 0 # simulation time
         self.dt = dt # simulation time step
-        self.visualizer = Visualizer(width, height, ppm=ppm)
+        self.width = width
+        self.height = height
+        self.ppm = ppm
+        # The visualizer (and so graphics.py and Tk) is only created when it is first needed. A headless world never creates it, so it
+        # can be used on machines without a display.
+        self.headless = headless
+        self._visualizer = None
+        self.recorder = None # if set to a FrameRecorder (see recorder.py), every render() also captures a frame, even when headless
+        self.logger = None # if set to a TrajectoryLogger (see logger.py), every tick() logs the state of the movable agents
+        # If batched, the movable agents become views into the arrays of an AgentBatch and they are all ticked with one vectorized update.
+        # This is much faster when there are many of them.
+        self.batch = AgentBatch() if batched else None
+        # Broadphase for collision checking: the collidable movable agents are hashed into a uniform grid of cell_size meters, and only the
+        # agents that share a cell are tested against each other. The collidable static agents are indexed by a bounding volume hierarchy,
+        # which is built on the first query after the set of static agents changes. Whether an agent is collidable is checked when it is
+        # added to the world.
+        # The movable agents are only re-hashed into the grid when it is needed after a tick or after they were moved, see the grid property.
+        self._grid = UniformGrid(cell_size)
+        self._grid_dirty = False
+        self._moved = {} # id(agent) -> agent, the movable agents whose poses were set since the grid was last updated (see Entity._pose_changed)
+        self._static_index = None
+        self._colliding_pairs = None # cache for colliding_pairs()
+        self.static_version = 0 # incremented whenever the set of static agents changes, so that anything derived from them can be cached
+        # In continuous mode, the collision checks test the shapes the movable agents swept during the last tick (see ccd.py) instead of
+        # only their current shapes, so that fast agents cannot jump over thin obstacles and larger time steps can be used.
+        self.continuous = continuous
+        self._start_poses = None # the poses of the movable agents before the last tick, only kept in continuous mode
+        self._end_versions = None # and their pose versions right after it, to tell which agents were moved directly since then
+        # If a tolerance (in meters) is given, each movable agent's tick is split into as many steps as needed to keep its position error
+        # below it (at most max_substeps, see dynamics.substep_counts). Agents that go straight or slowly still take one step, so dt can
+        # be large without losing accuracy in the sharp turns.
+        self.tolerance = tolerance
+        self.max_substeps = max_substeps
+        self.run_stats = None # the RunStats of the last run()
         
     def add(self, entity: Entity):
+        self._colliding_pairs = None
         if entity.movable:
             self.dynamic_agents.append(entity)
+            if self.batch is not None:
+                self.batch.add(entity)
+            if entity.collidable:
+                self._grid.insert(entity)
+            entity._pose_listener = self._moved
         else:
             self.static_agents.append(entity)
+            self.static_version += 1
+            if entity.collidable:
+                self._static_index = None
         
     def tick(self):
-        for agent in self.dynamic_agents:
-            agent.tick(self.dt)
+        if self.continuous:
+            self._start_poses = self._poses()
+        if self.batch is not None:
+            substeps = None
+            if self.tolerance is not None and len(self.batch) > 0:
+                b, n = self.batch, len(self.batch)
+                speed = np.sqrt(b.velocity[:n,0]**2 + b.velocity[:n,1]**2)
+                substeps = substep_counts(speed, b.inputSteering[:n], b.inputAcceleration[:n], b.friction[:n], b.rear_dist[:n],
+                                          b.min_speed[:n], b.max_speed[:n], self.dt, self.tolerance, self.max_substeps)
+            self.batch.tick(self.dt, substeps)
+        else:
+            for agent in self.dynamic_agents:
+                substeps = 1
+                if self.tolerance is not None:
+                    substeps = int(substep_counts(agent.speed, agent.inputSteering, agent.inputAcceleration, agent.friction, agent.rear_dist,
+                                                  agent.min_speed, agent.max_speed, self.dt, self.tolerance, self.max_substeps))
+                for _ in range(substeps):
+                    agent.tick(self.dt / substeps)
+        if self.continuous:
+            self._end_versions = [agent.pose_version for agent in self.dynamic_agents]
+        self._grid_dirty = True # this re-hashes every agent, so the ones the tick moved need not be tracked
+        self._moved.clear()
+        self._colliding_pairs = None
         self.t += self.dt
+        if self.logger is not None: self.logger.log(self)
+    
+    @property
+    def grid(self) -> UniformGrid:
+        # Updating the grid needs the geometry of the movable agents, which is built lazily (see Entity.obj). So it is postponed until
+        # the grid is used, and ticks without any collision queries do not build any geometry.
+        # Besides after a tick, the agents that were moved directly (e.g. with agent.center = Point(...)) are re-hashed, and then the
+        # cached colliding pairs are out of date too.
+        if self._grid_dirty or self._moved:
+            if self._grid_dirty:
+                agents = [agent for agent in self.dynamic_agents if agent in self._grid]
+            else:
+                agents = [agent for agent in self._moved.values() if agent in self._grid]
+                if agents: self._colliding_pairs = None
+            self._moved.clear() # the agents hold this dict, so it must stay the same object
+            if self.continuous and agents: # the agents are registered with the boxes of their swept shapes
+                for agent, box in zip(agents, swept_boxes(agents, *self._swept_poses(agents)).tolist()):
+                    self._grid.update(agent, tuple(box))
+            else:
+                for agent in agents:
+                    self._grid.update(agent)
+            self._grid_dirty = False
+        return self._grid
+    
+    def _poses(self) -> np.ndarray:
+        # The poses (x, y, heading) of the movable agents as an N x 3 array
+        if self.batch is not None:
+            n = len(self.batch)
+            return np.column_stack([self.batch.center[:n], self.batch.heading[:n]])
+        return np.array([(agent.center.x, agent.center.y, agent.heading) for agent in self.dynamic_agents], dtype=np.float64).reshape(-1, 3)
+    
+    def _swept_poses(self, agents: list) -> tuple:
+        # The start and end poses of the given movable agents during the last tick. The agents that did not exist then have not moved, and
+        # neither have the ones that were moved directly after it (e.g. put back to their start in a reset): they did not travel in between.
+        rows = {id(agent): k for k, agent in enumerate(self.dynamic_agents)}
+        poses = self._poses()
+        ends = poses[[rows[id(agent)] for agent in agents]].reshape(-1, 3)
+        starts = ends.copy()
+        if self._start_poses is not None:
+            for i, agent in enumerate(agents):
+                k = rows[id(agent)]
+                if k < len(self._start_poses) and self._end_versions[k] == agent.pose_version: starts[i] = self._start_poses[k]
+        return starts, ends
+    
+    def run(self, num_ticks: int = None, controller = None, real_time_factor: float = 1., fps: float = 30., max_frame_skip: int = 5) -> RunStats:
+        # Runs the simulation loop: calls controller(world) (if given) and ticks at real_time_factor times real time (as fast as possible
+        # if it is None), and renders at most fps frames per second, skipping frames when the simulation falls behind. Stops after
+        # num_ticks ticks or when the controller returns False, and returns the achieved rates (see scheduler.py).
+        self.run_stats = run(self, num_ticks, controller, real_time_factor, fps, max_frame_skip)
+        return self.run_stats
+    
+    @property
+    def visualizer(self):
+        if self._visualizer is None:
+            assert not self.headless, 'A headless World does not have a visualizer'
+            from visualizer import Visualizer # this imports graphics.py, which starts Tk
+            self._visualizer = Visualizer(self.width, self.height, ppm=self.ppm)
+        return self._visualizer
     
     def render(self):
+        if self.recorder is not None: self.recorder.capture(self)
+        if self.headless: return
         self.visualizer.create_window(bg_color = 'gray')
         self.visualizer.update_agents(self.agents)
         
@@ -30,32 +162,149 @@ class World:
     def agents(self):
         return self.static_agents + self.dynamic_agents
         
+    @property
+    def static_index(self) -> StaticBVH:
+        if self._static_index is None:
+            self._static_index = StaticBVH([agent for agent in self.static_agents if agent.collidable])
+        return self._static_index
+        
     def collision_exists(self, agent = None):
         if agent is None:
-            for i in range(len(self.dynamic_agents)):
-                for j in range(i+1, len(self.dynamic_agents)):
-                    if self.dynamic_agents[i].collidable and self.dynamic_agents[j].collidable:
-                        if self.dynamic_agents[i].collidesWith(self.dynamic_agents[j]):
-                            return True
-                for j in range(len(self.static_agents)):
-                    if self.dynamic_agents[i].collidable and self.static_agents[j].collidable:
-                        if self.dynamic_agents[i].collidesWith(self.static_agents[j]):
-                            return True
-            return False
+            return len(self.colliding_pairs()) > 0
             
         if not agent.collidable: return False
         
-        for i in range(len(self.agents)):
-            if self.agents[i] is not agent and self.agents[i].collidable and agent.collidesWith(self.agents[i]):
-                return True
-        return False
+        if agent in self.grid: # the agent is a movable agent of this world, so the cached contacts have it
+            return any(agent is agent1 or agent is agent2 for agent1, agent2 in self.colliding_pairs())
+        
+        box = bounding_box(agent)
+        pairs = [(agent, other) for other in self.grid.query(box) + self.static_index.query(box) if other is not agent and other.collidable]
+        return self._narrowphase(pairs).any()
+        
+    def colliding_pairs(self) -> list:
+        # Returns all (agent, agent) pairs that are colliding right now, where the first agent is always movable. They are found in one
+        # broadphase and narrowphase sweep, and the result is cached until the next tick (or until the set of agents changes or an agent
+        # is moved), so that it can be shared by everything that needs collision information at this time step.
+        grid = self.grid # this drops the cached pairs if an agent was moved
+        if self._colliding_pairs is None:
+            pairs = [(agent1, agent2) for agent1, agent2 in grid.pairs() if agent1.collidable and agent2.collidable]
+            static_index = self.static_index
+            for agent1 in grid.entities.values():
+                if agent1.collidable:
+                    pairs += [(agent1, agent2) for agent2 in static_index.query(grid.boxes[id(agent1)])]
+            collides = self._continuous_narrowphase(pairs) if self.continuous else self._narrowphase(pairs)
+            self._colliding_pairs = [pair for pair, c in zip(pairs, collides) if c]
+        return self._colliding_pairs
+        
+    def _narrowphase(self, pairs: list) -> np.ndarray:
+        # Checks the candidate pairs from the broadphase. The pairs of two rectangles are all checked at once with the separating axis
+        # test in kernels.py, the others with collidesWith.
+        collides = np.zeros(len(pairs), dtype=bool)
+        is_rectangle_pair = np.array([isinstance(agent1, RectangleEntity) and isinstance(agent2, RectangleEntity) for agent1, agent2 in pairs], dtype=bool)
+        if is_rectangle_pair.any():
+            collides[is_rectangle_pair] = self._rectangle_overlaps([pair for pair, r in zip(pairs, is_rectangle_pair) if r])
+        for k in np.flatnonzero(~is_rectangle_pair):
+            collides[k] = pairs[k][0].collidesWith(pairs[k][1])
+        return collides
+        
+    def _continuous_narrowphase(self, pairs: list) -> np.ndarray:
+        # Checks the swept shape of the first (movable) agent of each pair against the current shape of the second. If the second agent
+        # also moved, the first one is swept relative to it: its start pose is shifted by the displacement of the second agent, which is
+        # exact if the second agent only translated during the tick.
+        if not pairs: return np.zeros(0, dtype=bool)
+        agents1, agents2 = [pair[0] for pair in pairs], [pair[1] for pair in pairs]
+        starts, ends = self._swept_poses(agents1)
+        moving = [k for k, agent in enumerate(agents2) if agent.movable]
+        if moving:
+            starts2, ends2 = self._swept_poses([agents2[k] for k in moving])
+            starts[moving,:2] += ends2[:,:2] - starts2[:,:2]
+        return swept_distances(agents1, starts, ends, agents2) <= 0
+        
+    def _rectangle_overlaps(self, pairs: list) -> np.ndarray:
+        centers1, half_sizes1, headings1 = rectangle_arrays([pair[0] for pair in pairs])
+        centers2, half_sizes2, headings2 = rectangle_arrays([pair[1] for pair in pairs])
+        return rectangles_overlap(centers1, half_sizes1, headings1, centers2, half_sizes2, headings2)
+        
+    def distances_from(self, entity: Entity, others: list = None) -> np.ndarray:
+        # Returns the distances from the entity to the others (all agents of the world by default) as an array, computed with the
+        # vectorized kernels in kernels.py
+        if others is None: others = self.agents
+        return distance_matrix([entity], others)[0]
+        
+    def distance_matrix(self, entities: list = None) -> np.ndarray:
+        # Returns the matrix of distances between all pairs of the given entities (all agents of the world by default)
+        if entities is None: entities = self.agents
+        return distance_matrix(entities)
+        
+    def nearest_obstacle(self, agent: Entity, max_distance: float = np.inf) -> tuple:
+        # Returns the closest collidable static agent and its distance to the given agent, or (None, max_distance) if there is no static
+        # agent closer than max_distance
+        return self.static_index.nearest(agent, max_distance)
+    
+    def rollout(self, agent: Entity, controls: np.ndarray) -> tuple:
+        # Simulates the K x H x 2 candidate control sequences for the agent from its current state with the time step of the world, and
+        # returns the K x H x 4 states and the K x H collision flags against the static agents (see rollout.py). The world is not changed.
+        return rollout(agent, controls, self.dt, self.static_index)
     
+    # The columns of the state arrays of snapshot() and restore()
+    snapshot_columns = ['x', 'y', 'heading', 'xp', 'yp', 'acceleration', 'angular_velocity', 'inputSteering', 'inputAcceleration']
+        
+    def snapshot(self) -> tuple:
+        # Returns (t, states), where states is an N x 9 array of the mutable states of the N movable agents (see snapshot_columns). The
+        # static agents are not part of a snapshot, they are shared by all the states the world is restored to.
+        if self.batch is not None:
+            n = len(self.batch)
+            b = self.batch
+            states = np.column_stack([b.center[:n], b.heading[:n], b.velocity[:n], b.acceleration[:n], b.angular_velocity[:n],
+                                      b.inputSteering[:n], b.inputAcceleration[:n]])
+        else:
+            states = np.array([(a.center.x, a.center.y, a.heading, a.velocity.x, a.velocity.y, a.acceleration, a.angular_velocity,
+                                a.inputSteering, a.inputAcceleration) for a in self.dynamic_agents], dtype=np.float64).reshape(-1, 9)
+        return self.t, states
+        
+    def restore(self, snapshot: tuple):
+        # Puts the movable agents back into the state of a snapshot taken from this world (with the same movable agents)
+        t, states = snapshot
+        assert len(states) == len(self.dynamic_agents), 'The snapshot is from a world with different movable agents'
+        if self.batch is not None:
+            n = len(self.batch)
+            b = self.batch
+            b.center[:n], b.heading[:n], b.velocity[:n] = states[:,0:2], states[:,2], states[:,3:5]
+            b.acceleration[:n], b.angular_velocity[:n] = states[:,5], states[:,6]
+            b.inputSteering[:n], b.inputAcceleration[:n] = states[:,7], states[:,8]
+            b.version += 1
+        else:
+            for agent, state in zip(self.dynamic_agents, states.tolist()):
+                agent.center = Point(state[0], state[1])
+                agent.heading = state[2]
+                agent.velocity = Point(state[3], state[4])
+                agent.acceleration, agent.angular_velocity, agent.inputSteering, agent.inputAcceleration = state[5:]
+        self._start_poses = None
+        self._grid_dirty = True
+        self._colliding_pairs = None
+        self.t = t
+        
     def close(self):
         self.reset()
         self.static_agents = []
-        if self.visualizer.window_created:
+        self.static_version += 1
+        self._static_index = None
+        self._grid.clear()
+        if self._visualizer is not None and self._visualizer.window_created:
             self.visualizer.close()
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.logger is not None:
+            self.logger.close()
         
     def reset(self):
+        if self.batch is not None:
+            self.batch.clear()
+        for agent in self.dynamic_agents:
+            self._grid.remove(agent)
+            agent._pose_listener = None
         self.dynamic_agents = []
+        self._moved.clear()
+        self._start_poses = None
+        self._colliding_pairs = None
         self.t = 0
\ No newline at end of file